@@ -4,6 +4,8 @@ import matplotlib.patches as patches
 import matplotlib.animation as animation
 import pandas as pd
 
+from utils import DETECTION_COLUMNS, group_detections_by_frame, read_flight
+
 RAW_CSV = False
 FRAME_WIDTH, FRAME_HEIGHT = 3840, 2160
 FPS = 30 #Frames per second
@@ -16,24 +18,18 @@ for flight_id in ids:
     if(RAW_CSV):
         file_path = f'data/flights/flight_{flight_id}.csv'
         df_full = pd.read_csv(file_path)
-    else:
-        file_path = f'data/jflights_new_ids/flight_{flight_id}.json'
-        df_full = pd.read_json(file_path)
-
-    df = df_full.copy()
+        df = df_full.copy()
 
     # Get Zebras data and drone postion grouped by frames (RAW CSV)
     def get_drone_and_zebras_coords(df):
         columns = ['latitude', 'longitude', "altitude", "compass_heading", "gimbal_pitch", "height_sonar", "height_above_takeoff", "altitude_above_seaLevel", 'ground_elevation']
-        dff = df.loc[:, ['frame', "id", "xtl", "ytl", "xbr", "ybr", "behaviour"] + columns]
-        dff["box"] = dff.apply(lambda row: (row["id"], row["behaviour"], (row["xtl"], row["ytl"], row["xbr"], row["ybr"])), axis=1)
-        dff = dff.groupby(["frame"] + columns )["box"].apply(list).reset_index(name='animals')
-        return dff#df[columns].assign(animals=dff["animals"])
+        return group_detections_by_frame(df.loc[:, ['frame'] + DETECTION_COLUMNS + columns], ["frame"])
 
+    # One telemetry row per frame, the detections of frame i are the rows offsets[i]:offsets[i + 1] of detections
     if(RAW_CSV):
-        boxes = get_drone_and_zebras_coords(df)
+        boxes, detections, offsets = get_drone_and_zebras_coords(df)
     else:
-        boxes = df
+        boxes, detections, offsets = read_flight(f'data/jflights_new_ids/flight_{flight_id}')
 
     # Animation creation
     plt.rcParams['animation.ffmpeg_path'] = 'ffmpeg'
@@ -48,8 +44,12 @@ for flight_id in ids:
     def create_rectangle(xtl, ytl, xbr, ybr): 
         return patches.Rectangle((xtl, ybr), xbr - xtl, ytl - ybr, linewidth=4, edgecolor='g', facecolor='none')
 
+    # Telemetry value of a frame, read from its column so that it keeps the column type
+    def telemetry(f_id, value_name):
+        return boxes[value_name].iloc[f_id]
+
     def box_value(f_id, value_name):
-        return str(round(boxes.iloc[f_id][value_name],1))
+        return str(round(telemetry(f_id, value_name),1))
 
     def animate(f_id):
         for patch in ax.patches:
@@ -57,11 +57,10 @@ for flight_id in ids:
         for text in ax.texts:
             text.remove()
         
-        for box in boxes.iloc[f_id-1]["animals"]:
+        frame = (f_id - 1) % len(boxes)
+        for id, behaviour, xtl, ytl, xbr, ybr in detections.iloc[offsets[frame]:offsets[frame + 1]].itertuples(index=False):
             # Original coordinates has (0; 0) in top left corner
             # Matplotlib initial (0; 0) coordinates are in bottom left corner
-            id, behaviour, b  = tuple(box)
-            xtl, ytl, xbr, ybr = tuple(b)
             # invert top and bottom
             ytl = FRAME_HEIGHT - ytl 
             ybr = FRAME_HEIGHT - ybr
@@ -70,13 +69,13 @@ for flight_id in ids:
             text_y = (ytl + ybr) / 2
             ax.text(text_x, text_y, str(int(id)), color='black', ha='center', va='center', fontsize=17)
             ax.text(text_x, ytl + 40, behaviour, color='black', ha='center', va='center', fontsize=17)
-        coords = "(" + str(round(boxes.iloc[f_id]["latitude"], 6)) + "; " + str(round(boxes.iloc[f_id]["longitude"],6)) + ")\n"
-        alt = "Altitude: " + str(boxes.iloc[f_id]["altitude"]) + "m\n"
-        alt = alt + "Height   sonar: " + str(boxes.iloc[f_id]["height_sonar"]) + "m\n"
-        alt = alt + "Height takeoff: " + str(boxes.iloc[f_id]["height_above_takeoff"]) + "m\n"
-        alt = alt + "Altitude seaLevel: " + str(boxes.iloc[f_id]["altitude_above_seaLevel"]) + "m\n"
-        alt = alt + "Ground elevation: " + str(boxes.iloc[f_id]["ground_elevation"]) + "m\n"
-        alt = alt + "Diff AltSeaLevel - GroundElevation: " + str(round(boxes.iloc[f_id]["altitude_above_seaLevel"] - boxes.iloc[f_id]["ground_elevation"],1)) + "m\n"
+        coords = "(" + str(round(telemetry(f_id, "latitude"), 6)) + "; " + str(round(telemetry(f_id, "longitude"),6)) + ")\n"
+        alt = "Altitude: " + str(telemetry(f_id, "altitude")) + "m\n"
+        alt = alt + "Height   sonar: " + str(telemetry(f_id, "height_sonar")) + "m\n"
+        alt = alt + "Height takeoff: " + str(telemetry(f_id, "height_above_takeoff")) + "m\n"
+        alt = alt + "Altitude seaLevel: " + str(telemetry(f_id, "altitude_above_seaLevel")) + "m\n"
+        alt = alt + "Ground elevation: " + str(telemetry(f_id, "ground_elevation")) + "m\n"
+        alt = alt + "Diff AltSeaLevel - GroundElevation: " + str(round(telemetry(f_id, "altitude_above_seaLevel") - telemetry(f_id, "ground_elevation"),1)) + "m\n"
         orient = ""
         orient =  "compass: " + box_value(f_id, "compass_heading") + "°\ng_pitch: " + box_value(f_id, "gimbal_pitch") + "°"
         ax.text(20, FRAME_HEIGHT-600, (coords +alt + orient ), color="black", fontsize=30)
@@ -1,14 +1,15 @@
 # %%
 import pandas as pd
-import json
-from dateutil import parser
-from utils import create_folder_if_not_exists
+import numpy as np
+from utils import create_folder_if_not_exists, load_ground_elevation_table, lookup_ground_elevation, renumber_frames, group_detections_by_frame, animals_column, write_flight
 
 LATITUDE = "latitude"
 LONGITUDE = "longitude"
 ALTITUDE = "altitude"
 ALTITUDE_SEA = "altitude_above_seaLevel"
 
+JSON_EXPORT = False # also save each flight in the former JSON format, with the nested animals lists per frame
+
 file_path = 'data/KABR-telemetry/kabr_telemetry_raw.csv'
 df = pd.read_csv(file_path)
 
@@ -80,82 +81,67 @@ dff = df.copy()
 
 # Includes real world elevation to the dataframe
 def add_external_ground_elevation_column_to_df(df):
-    with open('ground_seaLevel_map.json', 'r') as f:
-        ground_json = json.load(f)
-    ground_map = {eval(key): value for key, value in ground_json.items()}
-
-    def add_ground_level(row):
-        return ground_map[(row["latitude"], row["longitude"])]
-
-    df["ground_elevation"] = df.apply(add_ground_level, axis=1)
+    ground_table = load_ground_elevation_table('ground_seaLevel_map.json')
+    df["ground_elevation"] = lookup_ground_elevation(ground_table, df["latitude"].values, df["longitude"].values)
     return df
 
 dff = add_external_ground_elevation_column_to_df(dff)
 
 # Calculates altitude based on real world ground elevation.
-def calc_alt(row):
-    return  round(row["altitude_above_seaLevel"] - row['ground_elevation'], 1)#- row["height_sonar"]
-
-dff["above_ground_altitude"] = dff.apply(calc_alt, axis=1)
+dff["above_ground_altitude"] = (dff["altitude_above_seaLevel"] - dff['ground_elevation']).round(1) #- dff["height_sonar"]
 
 #The frames enumeration in each DJI clip starts from zero (each clip max 5 minutes), after concatenation of consecutive clips we should fix enumeration of frames
 def fix_frames_enumeration(dataframe):
     new_df = dataframe.copy().reset_index(drop=True)
-    prev_frame_value = new_df.loc[0]["frame"]
-    offset = 0
-    for index, row in dataframe.reset_index(drop=True).iterrows():
-        current_frame_value = row["frame"]
-        if(current_frame_value < prev_frame_value):
-            offset = prev_frame_value + 1
-            i = index
-            while i < len(new_df):
-                if(current_frame_value == new_df.loc[i]['frame']):
-                    new_df.loc[i, 'frame'] = offset
-                    i += 1
-                else:
-                    break
-        prev_frame_value = new_df.loc[index]['frame']
+    new_df["frame"] = renumber_frames(new_df["frame"].to_numpy())
     return new_df
 
-def save_segment(segment, count):
-    if(not segment['frame'].is_monotonic_increasing):
-        segment = fix_frames_enumeration(segment)
+def save_segment(telemetry, detections, offsets, count):
+    if(not telemetry['frame'].is_monotonic_increasing):
+        telemetry = fix_frames_enumeration(telemetry)
         print(f"fix enumeration of sequence {count}")
-    create_folder_if_not_exists("data/jflights")
-    # segment.to_csv(f"data/flights/flight_{count}.csv", index=False) # Save files in CSV format
-    segment.to_json(f"data/jflights/flight_{count}.json", index=False)
+    write_flight(f"data/jflights/flight_{count}", telemetry, detections, offsets)
+    if(JSON_EXPORT):
+        telemetry.assign(animals=animals_column(detections, offsets)).to_json(f"data/jflights/flight_{count}.json", index=False)
 
+# Drone telemetry per frame and the detected zebras, see read_flight
 def get_drone_and_zebras_coords(df):
-    new_df = df.copy()
-    columns = [x for x in dff.columns.values if x not in ["id", "xtl", "ytl", "xbr", "ybr", "behaviour"]]
-    new_df["box"] = new_df.apply(lambda row: (row["id"], row["behaviour"], (row["xtl"], row["ytl"], row["xbr"], row["ybr"])), axis=1)
-    new_df = new_df.groupby(columns)["box"].apply(list).reset_index(name='animals')
-    return new_df
+    return group_detections_by_frame(df, ["date_time", "frame"])
+
+# Splits the records where the time between two consecutive records is more than max_gap seconds.
+# Returns the [start, end] positions of the sequences longer than min_records, and the start of the last sequence.
+def find_flight_sequences(times, max_gap=2, min_records=5000):
+    gaps = (times.diff().dt.seconds > max_gap).to_numpy(copy=True) # whole seconds, as timedelta.seconds
+    gaps[:2] = False
+    starts = np.concatenate([[0], np.flatnonzero(gaps)])
+    lengths = np.diff(starts)
+    long_sequences = np.flatnonzero(lengths > min_records)
+    return [(starts[i], starts[i + 1] - 1) for i in long_sequences], starts[-1]
+
+def write_segment(df_segment, count):
+    telemetry, detections, offsets = get_drone_and_zebras_coords(df_segment) # sorted by date_time and frame
+    save_segment(telemetry, detections, offsets, count)
 
 dff = dff.sort_values(by=["date_time", 'frame']).reset_index(drop=True)
 # %%
-prevIndx = 0
+sequences, last_start = find_flight_sequences(pd.to_datetime(dff["date_time"]))
+giraffes = (dff["label"] == "Giraffe").to_numpy().cumsum()
+segments = []
 count = 1
-prev_time = parser.parse(dff.loc[0]['date_time'])
-for index, row in dff.iterrows():
-    if((parser.parse(row['date_time']) - prev_time).seconds > 2 and index > 1):
-        sequence_distance = index-prevIndx
-        if(sequence_distance > 5000): 
-            df_segment = dff.loc[prevIndx: index - 1]
-            if "Giraffe" in df_segment["label"].unique():
-                print("ignore flight sequence with giraffes")
-            else:
-                print(f"Creating flight sequence {count}: records {sequence_distance}, range [{prevIndx}, {index - 1}] ")
-                df_segment = get_drone_and_zebras_coords(df_segment).sort_values(by=["date_time", 'frame']).reset_index(drop=True)
-                save_segment(df_segment, count)
-                count = count + 1
-        prevIndx = index
-        
-    prev_time = parser.parse(row['date_time'])
+for start, end in sequences:
+    if giraffes[end] > (giraffes[start - 1] if start > 0 else 0):
+        print("ignore flight sequence with giraffes")
+    else:
+        print(f"Creating flight sequence {count}: records {end - start + 1}, range [{start}, {end}] ")
+        segments.append((dff.loc[start: end], count))
+        count = count + 1
 print("Last sequence")
+segments.append((dff[last_start: dff.index[-1]], count))
 
-df_segment = get_drone_and_zebras_coords(dff[prevIndx: dff.index[-1]]).sort_values(by=["date_time", 'frame']).reset_index(drop=True)
-save_segment(df_segment, count)
+# Grouping and writing hold the GIL most of the time: the sequences are written one after the other
+create_folder_if_not_exists("data/jflights")
+for df_segment, count in segments:
+    write_segment(df_segment, count)
 
 # %% Optional
 # dff.to_csv('data/kabr_telemetry_clean.csv', index=False)
@@ -48,7 +48,7 @@ flights = range(1, 15)
 # flight 11 starts from [7800:] record
 for flight_id in flights:
     file_name = f'flight_{flight_id}'
-    file_path = f'data/jflights_new_ids/{file_name}.json'
+    flight_path = f'data/jflights_new_ids/{file_name}'
 
     zebras_output_folder_name = f"{output_folder}/{file_name}_zebras/"
     drone_output_folder_name = f"{output_folder}/{file_name}_drones/"
@@ -60,9 +60,10 @@ for flight_id in flights:
     if not os.path.exists(fov_output_folder_name):
         os.makedirs(fov_output_folder_name)
 
-    df = pd.read_json(file_path)
+    telemetry, detections, offsets = read_flight(flight_path)
 
-    telemetry_df = df[["latitude", "longitude", "altitude", "animals", "compass_heading", "gimbal_pitch"]].values.tolist()
+    telemetry_df = list(zip(*[telemetry[c].tolist() for c in ["latitude", "longitude", "altitude"]], animals_column(detections, offsets),
+                            *[telemetry[c].tolist() for c in ["compass_heading", "gimbal_pitch"]]))
 
     gpx_drone = gpxpy.gpx.GPX()
     gpx_zebras = gpxpy.gpx.GPX()
@@ -80,10 +81,7 @@ for flight_id in flights:
 
     zebras_segments_dict = dict()
 
-    ids = set()
-    for animals in df["animals"]:
-        for a in animals:
-            ids.add(a[0])
+    ids = set(detections["id"].tolist())
     print("The number of ids", len(ids))
 
     for i in ids:
@@ -12,15 +12,15 @@ ids = range(1, 15)
 # ids = [1]
 
 for flight_id in ids:
-    file_path = f'data/jflights/flight_{flight_id}.json'
+    flight_path = f'data/jflights/flight_{flight_id}'
 
-    df = pd.read_json(file_path)
-    df_original = df.copy()
+    telemetry, detections, offsets = read_flight(flight_path)
+    animals = animals_column(detections, offsets)
 
-    df['animals2'] = None
+    new_animals = [[] for _ in range(len(telemetry))]
     id_counter = 1
     active_animals = []
-    records = df['animals'][0]
+    records = animals[0]
     for record in records:
         animal = Animal(id_counter, record[DF_BOX_INDEX], record[DF_BEHAVIOR_INDEX])
         active_animals.append(animal)
@@ -28,11 +28,11 @@ for flight_id in ids:
         mylist= []
         for active in active_animals:
             mylist.append(active.get_export())
-        df.at[0, 'animals2'] = mylist
+        new_animals[0] = mylist
 
 
-    for idx in range(1, len(df)):
-        records = df['animals'][idx]
+    for idx in range(1, len(telemetry)):
+        records = animals[idx]
         records = remove_duplicate_records(records)
         distance_matrix = create_distance_matrix(active_animals, records)
         # print(distance_matrix)
@@ -68,11 +68,11 @@ for flight_id in ids:
         mylist = []
         for active in active_animals:
             mylist.append(active.get_export())
-        df.at[idx, 'animals2'] = mylist
+        new_animals[idx] = mylist
 
-    df.drop(columns=['animals'], inplace=True)
-    df.rename(columns={'animals2': "animals"}, inplace=True)
-    df.to_json(output_folder_name + f"flight_{flight_id}.json")
+    new_detections, new_offsets = detections_from_animals(new_animals)
+    write_flight(output_folder_name + f"flight_{flight_id}", telemetry, new_detections, new_offsets)
+    # telemetry.assign(animals=new_animals).to_json(output_folder_name + f"flight_{flight_id}.json")
     # df.to_csv(output_folder_name + f"flight_{flight_id}.csv")
     print("finish", flight_id)
 # %%
@@ -1,10 +1,19 @@
+import itertools
+import json
 import math
 import numpy as np
 import os
+import pandas as pd
 
 DF_BEHAVIOR_INDEX = 1
 DF_BOX_INDEX = 2
 
+DETECTION_COLUMNS = ["id", "behaviour", "xtl", "ytl", "xbr", "ybr"]
+BOX_COLUMNS = ["xtl", "ytl", "xbr", "ybr"]
+
+COORDINATE_SCALE = 10**6 # coordinates are rounded to 6 decimals
+LONGITUDE_RANGE = 400 * COORDINATE_SCALE # room for every longitude in the integer keys of the coordinates
+
 ### COMMON
 
 def create_folder_if_not_exists(folder_path):
@@ -19,6 +28,144 @@ def get_box_center(box):
     return x, y
 
 
+### Flights -----------------
+
+# The frames enumeration in each DJI clip starts from zero (each clip max 5 minutes), after concatenation of consecutive clips
+# the frames of every later clip are renumbered: each run of equal frames that is lower than the previous (renumbered) frame
+# takes the previous frame + 1. Runs are processed once, in linear time.
+def renumber_frames(frames):
+    frames = np.asarray(frames)
+    if len(frames) == 0:
+        return frames.copy()
+    run_starts = np.flatnonzero(np.concatenate([[True], frames[1:] != frames[:-1]]))
+    run_lengths = np.diff(np.append(run_starts, len(frames)))
+    renumbered = itertools.accumulate(frames[run_starts].tolist(), lambda prev, frame: frame if frame >= prev else prev + 1)
+    return np.repeat(np.fromiter(renumbered, dtype=frames.dtype, count=len(run_starts)), run_lengths)
+
+
+# Groups detection records by frame, a new frame starting whenever one of the keys changes.
+# Returns one telemetry row per frame (taken from its first record), the detections table, and the offsets
+# of each frame in it: the detections of frame i are the rows offsets[i]:offsets[i + 1].
+def group_detections_by_frame(df, keys):
+    df = df.sort_values(by=keys, kind="stable").reset_index(drop=True)
+    new_frame = np.zeros(len(df), dtype=bool)
+    new_frame[:1] = True
+    for key in keys:
+        values = df[key].to_numpy()
+        new_frame[1:] |= values[1:] != values[:-1]
+    starts = np.flatnonzero(new_frame)
+    telemetry = df.loc[starts, [c for c in df.columns if c not in DETECTION_COLUMNS]].reset_index(drop=True)
+    return telemetry, df[DETECTION_COLUMNS], np.append(starts, len(df))
+
+# Records [id, behaviour, [xtl, ytl, xbr, ybr]] of each frame, as used by the reconstruction (and the former JSON flight files)
+def animals_column(detections, offsets):
+    records = list(zip(detections["id"].tolist(), detections["behaviour"].tolist(), detections[BOX_COLUMNS].to_numpy().tolist()))
+    return [records[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+# Detections table and offsets of the records of each frame
+def detections_from_animals(animals):
+    offsets = np.zeros(len(animals) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(frame_animals) for frame_animals in animals])
+    records = [animal for frame_animals in animals for animal in frame_animals]
+    boxes = np.array([animal[DF_BOX_INDEX] for animal in records]).reshape(-1, len(BOX_COLUMNS))
+    detections = pd.DataFrame({"id": [animal[0] for animal in records], "behaviour": [animal[DF_BEHAVIOR_INDEX] for animal in records]})
+    detections[BOX_COLUMNS] = boxes
+    return detections[DETECTION_COLUMNS], offsets
+
+
+### Flight files ------------
+
+# A flight is a folder of .npy files, each one loadable as a memory map: one per telemetry column (a row per frame),
+# one per detection column (a row per detected animal, grouped by frame) and the offsets of the frames in the detections.
+# Text columns (behaviour, label, date_time) are stored as categorical codes, flight.json lists the columns and their categories.
+FLIGHT_META = "flight.json"
+
+def write_flight(folder, telemetry, detections, offsets):
+    meta = {"frames": len(telemetry)}
+    for table_name, table in (("telemetry", telemetry), ("detections", detections)):
+        os.makedirs(os.path.join(folder, table_name), exist_ok=True)
+        meta[table_name] = []
+        for column in table.columns:
+            values = table[column]
+            categories = None
+            if getattr(values.dtype, "kind", "O") not in "biufmM":
+                values = pd.Categorical(values)
+                categories = values.categories.tolist()
+                values = values.codes
+            np.save(os.path.join(folder, table_name, f"{column}.npy"), np.asarray(values))
+            meta[table_name].append([column, categories])
+    np.save(os.path.join(folder, "offsets.npy"), np.asarray(offsets, dtype=np.int64))
+    # written last, a flight without it is incomplete
+    with open(os.path.join(folder, FLIGHT_META), 'w') as f:
+        json.dump(meta, f)
+
+# Returns the telemetry and detections tables of a flight, and the offsets of each frame in the detections:
+# the detections of frame i are the rows offsets[i]:offsets[i + 1]. Numeric columns are memory maps unless mmap is False.
+def read_flight(folder, mmap=True):
+    with open(os.path.join(folder, FLIGHT_META), 'r') as f:
+        meta = json.load(f)
+    mmap_mode = "r" if mmap else None
+    def read_table(table_name):
+        columns = {}
+        for column, categories in meta[table_name]:
+            values = np.load(os.path.join(folder, table_name, f"{column}.npy"), mmap_mode=mmap_mode)
+            columns[column] = values if categories is None else pd.Categorical.from_codes(values, categories)
+        return pd.DataFrame(columns, copy=False)
+    return read_table("telemetry"), read_table("detections"), np.load(os.path.join(folder, "offsets.npy"))
+
+
+### Ground elevation --------
+
+# Integer key of each (latitude, longitude) pair rounded to 6 decimals
+def coordinates_key(latitudes, longitudes):
+    lat = np.rint(np.asarray(latitudes, dtype=np.float64) * COORDINATE_SCALE).astype(np.int64)
+    lon = np.rint(np.asarray(longitudes, dtype=np.float64) * COORDINATE_SCALE).astype(np.int64)
+    return lat * LONGITUDE_RANGE + lon
+
+# Loads the map of ground elevations as a table sorted by coordinates key.
+# The table is cached in the cache folder and rebuilt when the map changes.
+def load_ground_elevation_table(json_path, cache_folder="data"):
+    create_folder_if_not_exists(cache_folder)
+    cache_path = os.path.join(cache_folder, os.path.splitext(os.path.basename(json_path))[0] + ".npz")
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(json_path):
+        with np.load(cache_path) as cached:
+            return {name: cached[name] for name in cached.files}
+    with open(json_path, 'r') as f:
+        ground_json = json.load(f)
+    # keys are "(latitude, longitude)" strings
+    coordinates = np.array([key.strip("()").split(",") for key in ground_json.keys()], dtype=np.float64).reshape(-1, 2)
+    elevations = np.fromiter(ground_json.values(), dtype=np.float64, count=len(ground_json))
+    keys = coordinates_key(coordinates[:, 0], coordinates[:, 1])
+    order = np.argsort(keys, kind="stable")
+    table = {"keys": keys[order], "latitudes": coordinates[order, 0], "longitudes": coordinates[order, 1], "elevations": elevations[order]}
+    np.savez(cache_path, **table)
+    return table
+
+# Ground elevation of each coordinate, looked up in the sorted table.
+# Coordinates missing from the table take the elevation of the nearest known coordinate.
+def lookup_ground_elevation(table, latitudes, longitudes):
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    keys = coordinates_key(latitudes, longitudes)
+    positions = np.minimum(np.searchsorted(table["keys"], keys), len(table["keys"]) - 1)
+    found = table["keys"][positions] == keys
+    elevations = table["elevations"][positions]
+    if not found.all():
+        missing_keys, first, inverse = np.unique(keys[~found], return_index=True, return_inverse=True)
+        missing_lat = latitudes[~found][first]
+        missing_lon = longitudes[~found][first]
+        # equirectangular distances, longitudes shrink with the cosine of the latitude
+        scale = np.cos(np.deg2rad(missing_lat))[:, None]
+        nearest = np.empty(len(missing_keys), dtype=np.int64)
+        for start in range(0, len(missing_keys), 1024): # bounded memory for the distance matrix
+            block = slice(start, start + 1024)
+            distances = (missing_lat[block, None] - table["latitudes"]) ** 2 + ((missing_lon[block, None] - table["longitudes"]) * scale[block]) ** 2
+            nearest[block] = np.argmin(distances, axis=1)
+        elevations[~found] = table["elevations"][nearest][inverse]
+        print(f"{len(missing_keys)} coordinates without ground elevation, using the nearest known one")
+    return elevations
+
+
 ### Rewrite ids -------------
 
 def create_distance_matrix(active_animals, records):
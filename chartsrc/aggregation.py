@@ -0,0 +1,195 @@
+import numpy as np
+import xarray as xr
+
+class SeedAggregator:
+    """
+    Folds resampled exports into running statistics over the seed variables,
+    one file at a time, without keeping the raw series in memory.
+    Means and variances are updated with Welford's online algorithm; NaN
+    values are treated as missing samples, as xarray does when skipping NaN.
+
+    For every cell of the non-seed dimensions it keeps:
+    - the mean over seeds of every metric at each time sample (seedMean)
+    - mean and standard deviation over seeds of the time mean of every metric
+      (timeMeanSeedMean, timeMeanSeedStd)
+    - mean and standard deviation over seeds of the time sum of every metric,
+      plus the ratios between sums (timeSumSeedMean, timeSumSeedStd)
+    """
+
+    def __init__(self, dimensions, seedVars, metrics, timeline, ratios=None):
+        """
+        Parameters
+        ----------
+        dimensions : dict
+            coordinate name to sorted coordinate values, time excluded
+        seedVars : list of str
+            the dimensions to aggregate over
+        metrics : list of str
+            the exported columns to aggregate, time excluded
+        timeline : numpy.ndarray
+            the time samples the exports are resampled on
+        ratios : dict, optional
+            derived metrics computed on the time sums of each run, as
+            name to (numerator, denominator) metric names
+        """
+        self.seedVars = list(seedVars)
+        self.dims = [d for d in dimensions if d not in self.seedVars]
+        self.coords = {d: list(dimensions[d]) for d in self.dims}
+        self.index = {d: {v: i for i, v in enumerate(values)} for d, values in self.coords.items()}
+        self.metrics = list(metrics)
+        self.ratios = dict(ratios or {})
+        self.timeline = np.asarray(timeline)
+        shape = tuple(len(v) for v in self.coords.values())
+        sumMetrics = len(self.metrics) + len(self.ratios)
+        self.state = {
+            'inTimeCount': np.zeros((len(self.metrics),) + shape + (len(self.timeline),), dtype=np.int64),
+            'inTimeMean': np.zeros((len(self.metrics),) + shape + (len(self.timeline),)),
+            'timeMeanCount': np.zeros((len(self.metrics),) + shape, dtype=np.int64),
+            'timeMeanMean': np.zeros((len(self.metrics),) + shape),
+            'timeMeanM2': np.zeros((len(self.metrics),) + shape),
+            'timeSumCount': np.zeros((sumMetrics,) + shape, dtype=np.int64),
+            'timeSumMean': np.zeros((sumMetrics,) + shape),
+            'timeSumM2': np.zeros((sumMetrics,) + shape),
+        }
+
+    @staticmethod
+    def _fold(count, mean, m2, values):
+        valid = ~np.isnan(values)
+        n = count + valid
+        delta = np.where(valid, values - mean, 0)
+        newMean = mean + np.where(valid, delta / np.maximum(n, 1), 0)
+        count[...] = n
+        if m2 is not None:
+            m2 += np.where(valid, delta * (values - newMean), 0)
+        mean[...] = newMean
+
+    def add(self, export):
+        """
+        Folds a resampled export into the statistics of its cell, growing the
+        coordinates if the export belongs to a cell not seen before.
+
+        Parameters
+        ----------
+        export : AlchemistExport
+            an export resampled on the timeline of the aggregator
+        """
+        unknown = {d: [export.coordinates[d]] for d in self.dims if export.coordinates[d] not in self.index[d]}
+        if unknown:
+            self.grow(unknown)
+        cell = (slice(None),) + tuple(self.index[d][export.coordinates[d]] for d in self.dims)
+        columns = [export.variables.index(m) for m in self.metrics]
+        values = export.data[:, columns].T
+        s = self.state
+        self._fold(s['inTimeCount'][cell], s['inTimeMean'][cell], None, values)
+        valid = ~np.isnan(values)
+        samples = valid.sum(axis=1)
+        sums = np.where(valid, values, 0).sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            timeMeans = np.where(samples > 0, sums / np.maximum(samples, 1), np.nan)
+            ratios = [sums[self.metrics.index(n)] / sums[self.metrics.index(d)] for n, d in self.ratios.values()]
+        self._fold(s['timeMeanCount'][cell], s['timeMeanMean'][cell], s['timeMeanM2'][cell], timeMeans)
+        self._fold(s['timeSumCount'][cell], s['timeSumMean'][cell], s['timeSumM2'][cell], np.concatenate([sums, ratios]))
+
+    def grow(self, dimensions):
+        """
+        Extends the aggregator with new coordinate values, with empty statistics.
+
+        Parameters
+        ----------
+        dimensions : dict
+            coordinate name to coordinate values, seed variables and unknown
+            dimensions are ignored
+        """
+        newCoords = {d: sorted(set(self.coords[d]) | set(dimensions.get(d, []))) for d in self.dims}
+        if all(len(newCoords[d]) == len(self.coords[d]) for d in self.dims):
+            return
+        positions = [np.array([newCoords[d].index(v) for v in self.coords[d]]) for d in self.dims]
+        for name, old in self.state.items():
+            axes = [np.arange(old.shape[0])] + positions + [np.arange(n) for n in old.shape[1 + len(self.dims):]]
+            new = np.zeros((old.shape[0],) + tuple(len(newCoords[d]) for d in self.dims) + old.shape[1 + len(self.dims):], dtype=old.dtype)
+            new[np.ix_(*axes)] = old
+            self.state[name] = new
+        self.coords = newCoords
+        self.index = {d: {v: i for i, v in enumerate(values)} for d, values in self.coords.items()}
+
+    def results(self):
+        """
+        Computes the aggregated views.
+
+        Returns
+        -------
+        dict
+            A dictionary of xarray.Dataset: seedMean (with time),
+            timeMeanSeedMean, timeMeanSeedStd, timeSumSeedMean and timeSumSeedStd.
+            Cells without samples are NaN, standard deviations use ddof=0 as xarray.
+        """
+        s = self.state
+        def mean(count, m):
+            return np.where(count > 0, m, np.nan)
+        def std(count, m2):
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return np.where(count > 0, np.sqrt(m2 / count), np.nan)
+        def dataset(names, values, time=False):
+            dims = self.dims + (['time'] if time else [])
+            coords = dict(self.coords, **({'time': self.timeline} if time else {}))
+            return xr.Dataset({name: (dims, values[i]) for i, name in enumerate(names)}, coords=coords)
+        sumNames = self.metrics + list(self.ratios)
+        return {
+            'seedMean': dataset(self.metrics, mean(s['inTimeCount'], s['inTimeMean']), time=True),
+            'timeMeanSeedMean': dataset(self.metrics, mean(s['timeMeanCount'], s['timeMeanMean'])),
+            'timeMeanSeedStd': dataset(self.metrics, std(s['timeMeanCount'], s['timeMeanM2'])),
+            'timeSumSeedMean': dataset(sumNames, mean(s['timeSumCount'], s['timeSumMean'])),
+            'timeSumSeedStd': dataset(sumNames, std(s['timeSumCount'], s['timeSumM2'])),
+        }
+
+    def toDataset(self):
+        """
+        Exports the running state, so that it can be stored and folded further later.
+
+        Returns
+        -------
+        xarray.Dataset
+            A dataset holding the accumulators
+        """
+        sumNames = self.metrics + list(self.ratios)
+        variables = {}
+        for name, values in self.state.items():
+            metricDim = 'sumMetric' if name.startswith('timeSum') else 'metric'
+            dims = [metricDim] + self.dims + (['time'] if name.startswith('inTime') else [])
+            variables[name] = (dims, values)
+        attrs = {
+            'seedVars': ','.join(self.seedVars),
+            'ratios': ','.join(name + '=' + n + '/' + d for name, (n, d) in self.ratios.items()),
+        }
+        return xr.Dataset(variables, coords=dict(self.coords, metric=self.metrics, sumMetric=sumNames, time=self.timeline), attrs=attrs)
+
+    @classmethod
+    def fromDataset(cls, dataset):
+        """
+        Restores an aggregator saved with toDataset.
+
+        Parameters
+        ----------
+        dataset : xarray.Dataset
+            a dataset produced by toDataset
+
+        Returns
+        -------
+        SeedAggregator
+            The restored aggregator
+        """
+        dims = [d for d in dataset['timeMeanMean'].dims if d != 'metric']
+        ratios = {}
+        for ratio in filter(None, dataset.attrs['ratios'].split(',')):
+            name, fraction = ratio.split('=')
+            ratios[name] = tuple(fraction.split('/'))
+        aggregator = cls(
+            {d: dataset.coords[d].values.tolist() for d in dims},
+            dataset.attrs['seedVars'].split(','),
+            dataset.coords['metric'].values.tolist(),
+            dataset.coords['time'].values,
+            ratios,
+        )
+        for name in aggregator.state:
+            aggregator.state[name] = dataset[name].values.copy()
+        return aggregator
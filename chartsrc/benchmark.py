@@ -0,0 +1,301 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+import xarray as xr
+
+import chartsrc.kcov_comparison as kcovlib
+from chartsrc.aggregation import SeedAggregator
+from chartsrc.ingest import ingestExports, resampleExports, buildDataset
+from chartsrc.reductions import AggregateCache
+from chartsrc.rendering import ChartPool
+from chartsrc.utils import Labels, compressedOpeners
+
+# Dimensions of the sweeps analysed by produce_simulation_graphs.py
+defaultDimensions = {
+    'Algorithm': ['ff_linpro_c', 'ff_linpro_ac'],
+    'NumberOfHerds': [2.0, 4.0, 6.0, 8.0],
+    'CamHerdRatio': [0.5, 1.0, 1.5, 2.0],
+    'ClusteringDistance': [10.0, 30.0, 50.0, 70.0, 400.0],
+    'Seed': [0.0, 1.0, 2.0],
+}
+defaultMetrics = ['1-coverage', '2-coverage', 'ObjDist', 'CamDist']
+
+separator = '#' * 69
+
+def writeSyntheticExport(path, coordinates, variables, data):
+    """
+    Writes a file with the layout of the exports of CustomCSVExporter.
+
+    Parameters
+    ----------
+    path : str
+        path of the file to write, compressed if it ends with a suffix of compressedOpeners
+    coordinates : dict
+        variable name to value, written in the header and in the data
+    variables : list of str
+        the column names
+    data : numpy.ndarray
+        matrix with one row per sample and one column per variable
+
+    """
+    with compressedOpeners.get(os.path.splitext(path)[1], open)(path, 'wt') as file:
+        file.write(separator + '\n')
+        file.write('# Alchemist log file - simulation started at: 1970-01-01T00:00+0000 #\n')
+        file.write(separator + '\n')
+        file.write('#\n')
+        file.write('# ' + ', '.join(k + ' = ' + str(v) for k, v in coordinates.items()) + '\n')
+        file.write('#\n')
+        file.write('# The columns have the following meaning: \n')
+        file.write('# ' + ''.join(v + ' ' for v in variables) + '\n')
+        np.savetxt(file, data, fmt='%.10g')
+        file.write(separator + '\n')
+        file.write('# End of data export. Simulation finished at: 1970-01-01T00:00+0000 #\n')
+        file.write(separator + '\n')
+
+def generateExports(directory, experiment, dimensions, metrics, rows, maxTime=1800, seed=0, compression=None):
+    """
+    Generates one synthetic export for every combination of the dimensions.
+    Times are increasing and irregular, coverages are in [0, 1] and the other
+    metrics are positive.
+
+    Parameters
+    ----------
+    directory : str
+        directory to write the exports in
+    experiment : str
+        the fileNameRoot of the exports
+    dimensions : dict
+        variable name to the list of its values
+    metrics : list of str
+        exported columns besides time
+    rows : int
+        samples per export
+    maxTime : float
+        time of the last sample
+    seed : int
+        seed of the random generator
+    compression : str, optional
+        compression suffix of the files (.gz, .xz or .bz2), None for plain text
+
+    Returns
+    -------
+    list of str
+        The paths of the generated files
+
+    """
+    rng = np.random.default_rng(seed)
+    files = []
+    names = list(dimensions)
+    for values in itertools.product(*dimensions.values()):
+        coordinates = dict(zip(names, values))
+        times = np.sort(rng.uniform(0, maxTime, rows))
+        times[0] = 0
+        data = rng.uniform(0, 1, (rows, len(metrics)))
+        for i, metric in enumerate(metrics):
+            if not metric.endswith('coverage'):
+                data[:, i] *= 100
+        path = os.path.join(directory, experiment + '_' + '_'.join(k + '-' + str(v) for k, v in coordinates.items()) + '.csv' + (compression or ''))
+        writeSyntheticExport(path, coordinates, ['time'] + metrics, np.column_stack([times, data]))
+        files.append(path)
+    return files
+
+def measure(function, repeat):
+    """
+    Runs a function several times, measuring the wall time of every run.
+
+    Parameters
+    ----------
+    function : callable
+        the function to run, without arguments
+    repeat : int
+        number of runs
+
+    Returns
+    -------
+    tuple
+        The result of the last run and the list of timings in seconds
+
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return result, timings
+
+def runBenchmark(directory, dimensions=None, metrics=None, rows=1000, timeSamples=360, maxTime=1800, repeat=3, workers=1, compression=None, dtype='float64', chartWorkers=1, previewDpi=None):
+    """
+    Generates a synthetic sweep and times each stage of the analysis pipeline
+    separately: ingest, resampling, dataset population, aggregation and every
+    chart family of KcovChartBuilder.
+
+    Parameters
+    ----------
+    directory : str
+        working directory for the exports and the charts
+    dimensions : dict, optional
+        variable name to the list of its values, defaults to defaultDimensions.
+        Algorithm, NumberOfHerds, CamHerdRatio, ClusteringDistance and Seed
+        are required by the charts.
+    metrics : list of str, optional
+        exported columns besides time, defaults to defaultMetrics
+    rows : int
+        samples per export
+    timeSamples : int
+        samples of the resampling timeline
+    maxTime : float
+        simulated time span
+    repeat : int
+        runs of each stage
+    workers : int
+        worker processes used for the ingest
+    compression : str, optional
+        compression suffix of the exports (.gz, .xz or .bz2), None for plain text
+    dtype : str
+        floating point type of the dataset
+    chartWorkers : int
+        worker processes rendering the charts
+    previewDpi : int, optional
+        draw the charts as PNG previews at this resolution, None for PDFs
+
+    Returns
+    -------
+    dict
+        The parameters, the environment and, for each stage, the timings in
+        seconds with their best and mean and the number of processed items
+
+    """
+    dimensions = dimensions or defaultDimensions
+    metrics = metrics or defaultMetrics
+    exportsDir = os.path.join(directory, 'exports')
+    chartsDir = os.path.join(directory, 'charts') + '/'
+    os.makedirs(exportsDir, exist_ok=True)
+    os.makedirs(chartsDir, exist_ok=True)
+    stages = {}
+    def stage(name, function, items):
+        result, timings = measure(function, repeat)
+        stages[name] = {'seconds': timings, 'best': min(timings), 'mean': sum(timings) / len(timings), 'items': items}
+        return result
+
+    files, generation = measure(lambda: generateExports(exportsDir, 'experiment_export', dimensions, metrics, rows, maxTime, compression=compression), 1)
+    timeline = np.linspace(0, maxTime, timeSamples)
+
+    exports = stage('ingest', lambda: ingestExports(files, 'time', workers=workers), len(files))
+    resampled = stage('resample', lambda: resampleExports(exports, 'time', timeline), len(files))
+    dataset = stage('populate', lambda: buildDataset(resampled, 'time', timeline, dtype=dtype), len(files))
+
+    def reduce():
+        dataMean = dataset.mean('time', dtype=np.float64)
+        dataDist = dataset.sum('time', dtype=np.float64)
+        return {
+            'seedMean': dataset.mean('Seed', dtype=np.float64),
+            'timeMeanSeedMean': dataMean.mean('Seed'),
+            'timeMeanSeedStd': dataMean.std('Seed'),
+            'timeSumSeedMean': dataDist.mean('Seed'),
+            'timeSumSeedStd': dataDist.std('Seed'),
+        }
+    aggregates = stage('aggregate', reduce, len(files))
+    def statistics():
+        # The specs of the script: one pass for the time statistics and the seed means in time, one for the seed statistics of each
+        runStats = [('statistics', {'time': ['time'], 'seed': ['Seed']}, ['mean', 'sum'])]
+        timeStats = runStats + [('grouping', 'time')]
+        seedStats = [('statistics', ['Seed'], ['mean', 'std'])]
+        cache = AggregateCache(None, dataset, None)
+        return {name: cache.get(spec) for name, spec in {
+            'seedMean': runStats + [('grouping', 'seed'), ('sel', {'statistic': 'mean'})],
+            'timeMeanSeedMean': timeStats + [('sel', {'statistic': 'mean'})] + seedStats + [('sel', {'statistic': 'mean'})],
+            'timeMeanSeedStd': timeStats + [('sel', {'statistic': 'mean'})] + seedStats + [('sel', {'statistic': 'std'})],
+            'timeSumSeedMean': timeStats + [('sel', {'statistic': 'sum'})] + seedStats + [('sel', {'statistic': 'mean'})],
+            'timeSumSeedStd': timeStats + [('sel', {'statistic': 'sum'})] + seedStats + [('sel', {'statistic': 'std'})],
+        }.items()}
+    stage('aggregateStatistics', statistics, len(files))
+    def stream():
+        aggregator = SeedAggregator({k: sorted(v) for k, v in dimensions.items()}, ['Seed'], metrics, timeline)
+        for export in resampled.values():
+            aggregator.add(export)
+        return aggregator.results()
+    stage('aggregateStreaming', stream, len(files))
+
+    algos = list(dimensions['Algorithm'])
+    kcovVariables = [m for m in metrics if m.endswith('coverage')][:2]
+    labels = Labels(['#00d0ebFF', '#61a72cFF'][:len(kcovVariables)], ['#0300ebFF', '#8cff9dFF'][:len(kcovVariables)],
+                    kcovVariables, [v.replace('coverage', 'cov') for v in kcovVariables])
+    dataKcovsMean = aggregates['timeMeanSeedMean'].mean('ClusteringDistance')
+    dataKcovsStd = aggregates['timeMeanSeedStd'].mean('ClusteringDistance')
+    pool = ChartPool(chartWorkers, release=kcovlib.releaseLayouts)
+    builder = kcovlib.KcovChartBuilder(chartsDir, dataKcovsMean, dataKcovsStd, algos, labels, previewDpi=previewDpi, pool=pool)
+    def drawn(function):
+        def draw():
+            function()
+            pool.wait()
+        return draw
+    herdNumbers = list(dimensions['NumberOfHerds'])
+    simRatios = list(dimensions['CamHerdRatio'])
+    distances = list(dimensions['ClusteringDistance'])
+    stage('surfaces', drawn(lambda: builder.surfaces(herdNumbers, simRatios)), 1)
+    stage('heatmaps', drawn(lambda: builder.heatmaps(simRatios, herdNumbers)), len(kcovVariables))
+    stage('compare', drawn(lambda: builder.compare(['Algorithm', 'NumberOfHerds', 'CamHerdRatio'], herdNumbers, simRatios, precision=1)), len(herdNumbers))
+    stage('lines', drawn(lambda: builder.lines(['Algorithm', 'NumberOfHerds'], herdNumbers, simRatios, 'CamHerdRatio', 'n/m', precision=1)), len(herdNumbers))
+    # The in-time charts draw four ratios on a 2x2 grid and two algorithms side by side, values are given as text as in the script
+    dataInTime = aggregates['seedMean'].mean('ClusteringDistance')
+    stage('inTime', drawn(lambda: builder.inTime(['Algorithm', 'NumberOfHerds', 'CamHerdRatio'], kcovVariables, dataInTime, herdNumbers[0], [str(r) for r in simRatios[:4]], maxTime)), len(kcovVariables))
+    dataByDistance = aggregates['seedMean'].mean('CamHerdRatio')
+    builder.algos = algos[:2]
+    stage('inTimeByValue', drawn(lambda: builder.inTimeByValue(['Algorithm', 'NumberOfHerds', 'ClusteringDistance'], kcovVariables, dataByDistance, herdNumbers[0], [str(d) for d in distances], maxTime, name='clust-distances', unit='m')), len(kcovVariables))
+    pool.close()
+
+    return {
+        'parameters': {
+            'dimensions': dimensions, 'metrics': metrics, 'files': len(files), 'rows': rows,
+            'timeSamples': timeSamples, 'maxTime': maxTime, 'repeat': repeat, 'workers': workers, 'compression': compression, 'dtype': dtype, 'chartWorkers': chartWorkers,
+            'previewDpi': previewDpi,
+            'generationSeconds': generation[0],
+        },
+        'environment': {
+            'python': platform.python_version(), 'numpy': np.__version__, 'xarray': xr.__version__,
+            'matplotlib': matplotlib.__version__, 'platform': platform.platform(), 'cpus': os.cpu_count(),
+        },
+        'stages': stages,
+    }
+
+def parseDimension(text):
+    name, values = text.split('=', 1)
+    return name, [float(v) if name != 'Algorithm' else v for v in values.split(',')]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Times the stages of the analysis pipeline on synthetic Alchemist exports.')
+    parser.add_argument('--dimension', action='append', type=parseDimension, default=[], metavar='NAME=V1,V2,...',
+                        help='values of a dimension, replacing the default ones (the files are their product)')
+    parser.add_argument('--metrics', type=lambda s: s.split(','), default=defaultMetrics, help='comma-separated exported columns besides time')
+    parser.add_argument('--extra-columns', type=int, default=0, help='additional unused columns in every export')
+    parser.add_argument('--rows', type=int, default=1000, help='samples per export')
+    parser.add_argument('--time-samples', type=int, default=360, help='samples of the resampling timeline')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of each stage')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes used for the ingest')
+    parser.add_argument('--chart-workers', type=int, default=1, help='worker processes rendering the charts')
+    parser.add_argument('--compression', choices=list(compressedOpeners), default=None, help='compress the exports')
+    parser.add_argument('--preview-dpi', type=int, default=None, help='draw the charts as PNG previews at this resolution')
+    parser.add_argument('--dtype', choices=['float64', 'float32'], default='float64', help='floating point type of the dataset')
+    parser.add_argument('--workdir', default=None, help='directory for exports and charts, a temporary one by default')
+    parser.add_argument('--output', default=None, help='JSON report path, standard output by default')
+    args = parser.parse_args()
+
+    dimensions = dict(defaultDimensions, **dict(args.dimension))
+    metrics = args.metrics + ['Extra' + str(i) for i in range(args.extra_columns)]
+    with tempfile.TemporaryDirectory() as tmp:
+        report = runBenchmark(args.workdir or tmp, dimensions, metrics, args.rows, args.time_samples, repeat=args.repeat, workers=args.workers, compression=args.compression, dtype=args.dtype, chartWorkers=args.chart_workers, previewDpi=args.preview_dpi)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
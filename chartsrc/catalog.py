@@ -0,0 +1,147 @@
+import os
+import pickle
+import re
+
+from chartsrc.utils import is_float, compressedOpeners
+
+# Alchemist names exports <fileNameRoot>_<var1>-<value1>_<var2>-<value2>...
+variableNameRegex = re.compile('(?:^|_)(?P<varName>[a-zA-Z]+)-')
+
+def stripExtension(name, extension='.csv'):
+    """
+    Removes the extension from the name of an export, compressed or not.
+
+    Parameters
+    ----------
+    name : str
+        name of the file
+    extension : str
+        the file extension, without the compression suffix
+
+    Returns
+    -------
+    str
+        The name without extension and compression suffix, None if the name
+        does not have the extension
+
+    """
+    for suffix in [extension] + [extension + compression for compression in compressedOpeners]:
+        if name.endswith(suffix):
+            return name[:len(name) - len(suffix)]
+    return None
+
+def parseExportName(name, experiment, extension='.csv'):
+    """
+    Extracts the variable values encoded by Alchemist in the name of an export file.
+
+    Parameters
+    ----------
+    name : str
+        name of the file, without directory
+    experiment : str
+        the fileNameRoot of the exporter
+    extension : str
+        the file extension, exports may also be compressed (e.g. .csv.gz)
+
+    Returns
+    -------
+    dict
+        A dictionary mapping variable names to values (floats when numeric),
+        or None if the name does not follow the Alchemist convention
+
+    """
+    stem = stripExtension(name, extension)
+    if not name.startswith(experiment) or stem is None:
+        return None
+    descriptor = stem[len(experiment):].lstrip('_')
+    matches = list(variableNameRegex.finditer(descriptor))
+    if not matches or matches[0].start() != 0:
+        return None
+    coordinates = {}
+    for match, following in zip(matches, matches[1:] + [None]):
+        value = descriptor[match.end():following.start() if following else len(descriptor)]
+        coordinates[match.group('varName')] = float(value) if is_float(value) else value
+    return coordinates
+
+def loadCatalog(path):
+    """
+    Loads the catalog saved by a previous run.
+
+    Parameters
+    ----------
+    path : str
+        path to the catalog file
+
+    Returns
+    -------
+    dict
+        A dictionary mapping file names to their coordinates (None if unparsable),
+        empty if no catalog exists
+
+    """
+    try:
+        with open(path, 'rb') as file:
+            return pickle.load(file)
+    except Exception:
+        return {}
+
+def saveCatalog(path, catalog):
+    """
+    Saves the catalog to disk.
+
+    Parameters
+    ----------
+    path : str
+        path to the catalog file
+    catalog : dict
+        the catalog to save
+
+    """
+    with open(path, 'wb') as file:
+        pickle.dump(catalog, file, protocol=-1)
+
+def updateCatalog(catalog, directory, experiment, extension='.csv'):
+    """
+    Lists the exports of an experiment, parsing only the names missing from the catalog.
+
+    Parameters
+    ----------
+    catalog : dict
+        the catalog of a previous run, possibly empty
+    directory : str
+        the directory containing the exports
+    experiment : str
+        the fileNameRoot of the exporter
+    extension : str
+        the file extension, compressed exports are listed as well
+
+    Returns
+    -------
+    dict
+        The catalog of the exports currently in the directory for the experiment
+
+    """
+    names = [name for name in os.listdir(directory) if name.startswith(experiment) and stripExtension(name, extension) is not None]
+    return { name: catalog[name] if name in catalog else parseExportName(name, experiment, extension) for name in names }
+
+def selectExports(catalog, selection=None):
+    """
+    Selects the exports whose coordinates match a selection, without opening them.
+    Exports whose name could not be parsed are always selected.
+
+    Parameters
+    ----------
+    catalog : dict
+        a dictionary mapping file names to their coordinates
+    selection : dict, optional
+        variable name to the list of accepted values, None selects everything
+
+    Returns
+    -------
+    list of str
+        The sorted names of the selected exports
+
+    """
+    def accepted(coordinates):
+        return coordinates is None or all(k in coordinates and coordinates[k] in v for k, v in (selection or {}).items())
+    return sorted(name for name, coordinates in catalog.items() if accepted(coordinates))
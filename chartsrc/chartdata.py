@@ -0,0 +1,70 @@
+import numpy as np
+import xarray as xr
+
+def selectBlock(dataset, variables, selection, dims):
+    """
+    Extracts the values plotted by a chart with a single vectorized selection.
+
+    Parameters
+    ----------
+    dataset : xarray.Dataset
+        the dataset holding the variables
+    variables : list of str
+        the variables to extract
+    selection : dict
+        dimension name to a label (the dimension is dropped) or a list of
+        labels (the values follow the order of the list)
+    dims : list of str
+        the order of the remaining dimensions in the result
+
+    Returns
+    -------
+    numpy.ndarray
+        An array indexed by variable, then by the dimensions in dims
+
+    """
+    selected = dataset[list(variables)].sel(**selection)
+    return np.stack([selected[v].transpose(*dims).values for v in variables])
+
+def surfaceData(dataarray, xcord, ycord):
+    """
+    Flattens a two-dimensional DataArray into the points of a surface, in the
+    order of its cells.
+
+    Parameters
+    ----------
+    dataarray : xarray.DataArray
+        the values of the surface
+    xcord : str
+        dimension providing the x coordinate
+    ycord : str
+        dimension providing the y coordinate
+
+    Returns
+    -------
+    tuple
+        Three flat numpy.ndarray with the x, y and z of every cell
+
+    """
+    xs, ys = xr.broadcast(dataarray[xcord], dataarray[ycord], dataarray)[:2]
+    return xs.transpose(*dataarray.dims).values.ravel(), ys.transpose(*dataarray.dims).values.ravel(), dataarray.values.ravel()
+
+def timeLimitIndex(times, timeLimit):
+    """
+    Finds where a sorted timeline reaches a limit.
+
+    Parameters
+    ----------
+    times : numpy.ndarray
+        sorted time samples
+    timeLimit : float
+        the time limit
+
+    Returns
+    -------
+    int
+        The index of the first sample not lower than the limit, the number of
+        samples if none is
+
+    """
+    return int(np.searchsorted(times, timeLimit, side='left'))
@@ -0,0 +1,506 @@
+import hashlib
+import os
+import pickle
+import numpy as np
+import xarray as xr
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from chartsrc.utils import parseAlchemistExport, resample, resampleStack, mergeDicts
+
+def resampleExport(export, timeColumnName, timeline):
+    """
+    Resamples the numeric block of a parsed export on the given timeline.
+
+    Parameters
+    ----------
+    export : AlchemistExport
+        a parsed Alchemist export
+    timeColumnName : str
+        name of the column holding the simulation time
+    timeline : numpy.ndarray
+        the time samples to resample on
+
+    Returns
+    -------
+    AlchemistExport
+        A copy of the export whose data has one row per timeline sample
+
+    """
+    timeColumn = export.variables.index(timeColumnName)
+    return export._replace(data=resample(timeColumn, timeline, export.data))
+
+def resampleExports(exports, timeColumnName, timeline):
+    """
+    Resamples a collection of parsed exports, batching together those sharing
+    the same columns and number of samples.
+
+    Parameters
+    ----------
+    exports : dict
+        a dictionary mapping files to their AlchemistExport
+    timeColumnName : str
+        name of the column holding the simulation time
+    timeline : numpy.ndarray
+        the time samples to resample on
+
+    Returns
+    -------
+    dict
+        A dictionary mapping each file to its resampled AlchemistExport, in the original order
+
+    """
+    batches = {}
+    for file, export in exports.items():
+        batches.setdefault((tuple(export.variables), export.data.shape), []).append(file)
+    resampled = {}
+    for (variables, _), files in batches.items():
+        timeColumn = variables.index(timeColumnName)
+        stack = resampleStack(timeColumn, timeline, np.stack([exports[file].data for file in files]))
+        for file, data in zip(files, stack):
+            resampled[file] = exports[file]._replace(data=data)
+    return { file: resampled[file] for file in exports }
+
+def ingestExport(path, timeColumnName, timeline=None, columns=None):
+    """
+    Parses an Alchemist export and, if a timeline is provided, resamples it.
+
+    Parameters
+    ----------
+    path : str
+        path to the target file
+    timeColumnName : str
+        name of the column holding the simulation time
+    timeline : numpy.ndarray, optional
+        the time samples to resample on, None to keep the raw samples
+    columns : list of str, optional
+        the columns to load besides time, None loads all of them
+
+    Returns
+    -------
+    AlchemistExport
+        The parsed (and possibly resampled) export
+
+    """
+    if columns is not None:
+        columns = [timeColumnName] + [c for c in columns if c != timeColumnName]
+    export = parseAlchemistExport(path, columns)
+    return export if timeline is None else resampleExport(export, timeColumnName, timeline)
+
+def ingestExports(files, timeColumnName, timeline=None, workers=1, columns=None):
+    """
+    Parses and resamples a collection of Alchemist exports, optionally fanning
+    the work out over a pool of worker processes.
+
+    Parameters
+    ----------
+    files : list of str
+        paths to the target files
+    timeColumnName : str
+        name of the column holding the simulation time
+    timeline : numpy.ndarray, optional
+        the time samples to resample on, None to keep the raw samples
+    workers : int
+        number of worker processes, 1 (or less) parses in the current process
+    columns : list of str, optional
+        the columns to load besides time, None loads all of them
+
+    Returns
+    -------
+    dict
+        A dictionary mapping each file to its AlchemistExport, in the order of files
+
+    """
+    ingest = partial(ingestExport, timeColumnName=timeColumnName, timeline=timeline, columns=columns)
+    if workers <= 1 or len(files) <= 1:
+        return { file: ingest(file) for file in files }
+    workers = min(workers, len(files))
+    chunksize = max(1, len(files) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return dict(zip(files, pool.map(ingest, files, chunksize=chunksize)))
+
+def aggregateExports(aggregator, files, timeColumnName, timeline, workers=1, batchSize=256, columns=None):
+    """
+    Streams exports into a SeedAggregator: files are parsed and resampled in
+    batches, folded into the aggregator and then discarded.
+
+    Parameters
+    ----------
+    aggregator : SeedAggregator
+        the aggregator to fold the exports into
+    files : list of str
+        paths to the target files
+    timeColumnName : str
+        name of the column holding the simulation time
+    timeline : numpy.ndarray
+        the time samples to resample on
+    workers : int
+        number of worker processes, 1 (or less) parses in the current process
+    batchSize : int
+        number of files held in memory at once
+    columns : list of str, optional
+        the columns to load besides time, None loads all of them
+
+    Returns
+    -------
+    dict
+        A dictionary mapping each file to its coordinates
+
+    """
+    coordinates = {}
+    for start in range(0, len(files), batchSize):
+        exports = ingestExports(files[start:start + batchSize], timeColumnName, timeline, workers=workers, columns=columns)
+        for file, export in exports.items():
+            aggregator.add(export)
+            coordinates[file] = export.coordinates
+    return coordinates
+
+def collectDimensions(exports, timeColumnName, timeSamples):
+    """
+    Computes the dimensions of the dataset from the coordinates of the exports.
+
+    Parameters
+    ----------
+    exports : dict
+        a dictionary mapping files to their AlchemistExport
+    timeColumnName : str
+        name of the column holding the simulation time
+    timeSamples : int
+        number of time samples
+
+    Returns
+    -------
+    dict
+        A dictionary whose keys are the dimension names and values the sorted coordinate values
+
+    """
+    dimensions = {}
+    for export in exports.values():
+        dimensions = mergeDicts(dimensions, export.coordinates)
+    dimensions = {k: sorted(v) for k, v in dimensions.items()}
+    # Add time to the independent variables
+    dimensions[timeColumnName] = range(0, timeSamples)
+    return dimensions
+
+def coordinateIndices(dataset, dims):
+    """
+    Maps the coordinate labels of a dataset to their integer positions.
+
+    Parameters
+    ----------
+    dataset : xarray.Dataset
+        the dataset whose coordinates are mapped
+    dims : list of str
+        the dimensions to map
+
+    Returns
+    -------
+    dict
+        A dictionary mapping each dimension to a dictionary from label to position
+
+    """
+    return {d: {v: i for i, v in enumerate(dataset.coords[d].values.tolist())} for d in dims}
+
+def cellIndex(coordinates, dims, indices, timeColumnName):
+    """
+    Computes the integer index of the cell of a run, spanning the whole timeline.
+
+    Parameters
+    ----------
+    coordinates : dict
+        coordinate name to value of the run
+    dims : tuple of str
+        the dimensions of the data variables
+    indices : dict
+        the label to position maps produced by coordinateIndices
+    timeColumnName : str
+        name of the time dimension
+
+    Returns
+    -------
+    tuple
+        A tuple usable to index the arrays of the data variables
+
+    """
+    return tuple(slice(None) if d == timeColumnName else indices[d][coordinates[d]] for d in dims)
+
+def populateDataset(dataset, exports, timeColumnName, timeline):
+    """
+    Writes the resampled data of the exports in the cells of the dataset
+    identified by their coordinates. Cells are addressed by integer position
+    and written in place in the arrays of the data variables.
+
+    Parameters
+    ----------
+    dataset : xarray.Dataset
+        the dataset to populate, it must already contain all the coordinates
+    exports : dict
+        a dictionary mapping files to their resampled AlchemistExport
+    timeColumnName : str
+        name of the column holding the simulation time
+    timeline : numpy.ndarray
+        the time samples the exports were resampled on
+
+    """
+    dataset[timeColumnName] = timeline
+    variables = list(dataset.data_vars)
+    dims = dataset[variables[0]].dims
+    indices = coordinateIndices(dataset, [d for d in dims if d != timeColumnName])
+    arrays = [dataset[v].values for v in variables]
+    for export in exports.values():
+        cell = cellIndex(export.coordinates, dims, indices, timeColumnName)
+        for array, column in zip(arrays, [export.variables.index(v) for v in variables]):
+            array[cell] = export.data[:, column]
+
+def buildDataset(exports, timeColumnName, timeline, dtype=np.float64):
+    """
+    Creates a dataset with a dimension per coordinate plus time, and one data
+    variable per exported column. Values are written by integer position in a
+    single preallocated block, wrapped into the dataset at the end.
+
+    Parameters
+    ----------
+    exports : dict
+        a dictionary mapping files to their resampled AlchemistExport
+    timeColumnName : str
+        name of the column holding the simulation time
+    timeline : numpy.ndarray
+        the time samples the exports were resampled on
+    dtype : numpy.dtype
+        floating point type of the data variables
+
+    Returns
+    -------
+    xarray.Dataset
+        The populated dataset, NaN where no export provides data
+
+    """
+    dimensions = collectDimensions(exports, timeColumnName, len(timeline))
+    dimensions[timeColumnName] = timeline
+    dims = tuple(dimensions)
+    indices = {d: {v: i for i, v in enumerate(values)} for d, values in dimensions.items() if d != timeColumnName}
+    variables = [v for v in next(iter(exports.values())).variables if v != timeColumnName]
+    block = np.full((len(variables),) + tuple(len(v) for v in dimensions.values()), np.nan, dtype=dtype)
+    for export in exports.values():
+        columns = [export.variables.index(v) for v in variables]
+        block[(slice(None),) + cellIndex(export.coordinates, dims, indices, timeColumnName)] = export.data[:, columns].T
+    return xr.Dataset({v: (dims, block[i]) for i, v in enumerate(variables)}, coords=dimensions)
+
+def updateDataset(dataset, exports, staleCoordinates, timeColumnName, timeline):
+    """
+    Merges new or changed exports into an existing dataset, growing its
+    coordinates where needed. When no coordinate is added, the data is written
+    in place into the dataset.
+
+    Parameters
+    ----------
+    dataset : xarray.Dataset
+        a dataset created by buildDataset on the same timeline, fully loaded in
+        memory. Its data type is preserved.
+    exports : dict
+        a dictionary mapping files to their resampled AlchemistExport
+    staleCoordinates : list of dict
+        coordinates of the cells whose data is outdated (removed or changed
+        files), they are reset to NaN before merging
+    timeColumnName : str
+        name of the column holding the simulation time
+    timeline : numpy.ndarray
+        the time samples the exports were resampled on
+
+    Returns
+    -------
+    xarray.Dataset
+        The updated dataset, or None if the exports do not fit its dimensions
+        or variables and the dataset must be rebuilt
+
+    """
+    dimensions = [k for k in dataset.dims if k != timeColumnName]
+    variables = set(dataset.data_vars)
+    for export in exports.values():
+        if set(export.coordinates) != set(dimensions) or set(export.variables) - {timeColumnName} != variables:
+            return None
+    grown = {}
+    for k in dimensions:
+        values = set(dataset.coords[k].values.tolist())
+        newValues = {export.coordinates[k] for export in exports.values()} - values
+        if newValues:
+            grown[k] = sorted(values | newValues)
+    if grown:
+        dataset = dataset.reindex(grown)
+    dims = dataset[next(iter(variables))].dims
+    indices = coordinateIndices(dataset, dimensions)
+    for coordinates in staleCoordinates:
+        cell = cellIndex(coordinates, dims, indices, timeColumnName)
+        for v in variables:
+            dataset[v].values[cell] = np.nan
+    populateDataset(dataset, exports, timeColumnName, timeline)
+    return dataset
+
+ExportState = namedtuple('ExportState', ['mtime', 'size', 'hash', 'coordinates'])
+
+def fileHash(path, blockSize=1 << 20):
+    """
+    Computes a digest of the content of a file, reading it in blocks.
+
+    Parameters
+    ----------
+    path : str
+        path to the target file
+    blockSize : int
+        size in bytes of the blocks read at once
+
+    Returns
+    -------
+    str
+        The hexadecimal BLAKE2 digest of the file
+
+    """
+    digest = hashlib.blake2b()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(blockSize), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def scanExports(files, previous):
+    """
+    Collects the state of the export files. Files whose modification time and
+    size match the previous manifest are trusted without being read, the
+    others are hashed.
+
+    Parameters
+    ----------
+    files : list of str
+        paths to the target files
+    previous : dict
+        the manifest of the previous run, mapping files to their ExportState
+
+    Returns
+    -------
+    dict
+        The current manifest, mapping files to their ExportState. Coordinates
+        are carried over from the previous manifest when the content did not change.
+
+    """
+    manifest = {}
+    for file in files:
+        stat = os.stat(file)
+        old = previous.get(file)
+        if old is not None and old.mtime == stat.st_mtime and old.size == stat.st_size:
+            manifest[file] = old
+            continue
+        digest = fileHash(file)
+        coordinates = old.coordinates if old is not None and old.hash == digest else None
+        manifest[file] = ExportState(stat.st_mtime, stat.st_size, digest, coordinates)
+    return manifest
+
+def diffManifest(previous, current):
+    """
+    Compares two manifests.
+
+    Parameters
+    ----------
+    previous : dict
+        the manifest of the previous run
+    current : dict
+        the manifest of the current run
+
+    Returns
+    -------
+    tuple of (list of str, list of str)
+        The files that are new or whose content changed, and the files that disappeared
+
+    """
+    changed = [file for file, state in current.items() if file not in previous or previous[file].hash != state.hash]
+    removed = [file for file in previous if file not in current]
+    return changed, removed
+
+def loadAvailableColumns(path):
+    """
+    Loads the columns available in the exports of each experiment, as recorded
+    by the last run, including those that were not loaded.
+
+    Parameters
+    ----------
+    path : str
+        path to the manifest file
+
+    Returns
+    -------
+    dict
+        A dictionary mapping each experiment to the list of its column names
+
+    """
+    try:
+        with open(path, 'rb') as file:
+            return pickle.load(file).get('availableColumns', {})
+    except Exception:
+        return {}
+
+def loadManifest(path, settings):
+    """
+    Loads the manifest saved by a previous run.
+
+    Parameters
+    ----------
+    path : str
+        path to the manifest file
+    settings : dict
+        the processing settings of the current run
+
+    Returns
+    -------
+    dict
+        A dictionary mapping each experiment to its manifest, empty if there is
+        no manifest or it was produced with different settings
+
+    """
+    try:
+        with open(path, 'rb') as file:
+            saved = pickle.load(file)
+    except Exception:
+        return {}
+    return saved['experiments'] if saved.get('settings') == settings else {}
+
+def saveManifest(path, settings, experiments, availableColumns=None):
+    """
+    Saves the manifests of the processed experiments.
+
+    Parameters
+    ----------
+    path : str
+        path to the manifest file
+    settings : dict
+        the processing settings of the current run
+    experiments : dict
+        a dictionary mapping each experiment to its manifest
+    availableColumns : dict, optional
+        a dictionary mapping each experiment to all the column names of its exports
+
+    """
+    with open(path, 'wb') as file:
+        pickle.dump({'settings': settings, 'experiments': experiments, 'availableColumns': availableColumns or {}}, file, protocol=-1)
+
+def manifestFingerprint(manifest, settings):
+    """
+    Identifies the data processed from a set of exports, without reading it:
+    the fingerprint changes whenever a file or a processing setting changes.
+
+    Parameters
+    ----------
+    manifest : dict
+        a dictionary mapping file paths to their ExportState
+    settings : dict
+        the processing settings
+
+    Returns
+    -------
+    str
+        The hexadecimal BLAKE2 digest of the file hashes and the settings
+
+    """
+    digest = hashlib.blake2b(repr(sorted(settings.items())).encode())
+    for file in sorted(manifest):
+        digest.update(os.path.basename(file).encode())
+        digest.update(manifest[file].hash.encode())
+    return digest.hexdigest()
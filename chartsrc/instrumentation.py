@@ -0,0 +1,170 @@
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None
+
+def maxRss():
+    """
+    Gets the peak resident memory of the process so far.
+
+    Returns
+    -------
+    int
+        The high-water mark in bytes, None if the platform does not provide it
+
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024 # bytes on macOS, kilobytes elsewhere
+
+def currentRss():
+    """
+    Gets the resident memory of the process now.
+
+    Returns
+    -------
+    int
+        The resident set size in bytes, None if the platform does not provide it
+
+    """
+    try:
+        with open('/proc/self/statm') as file: # Linux only
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+class StageRecorder:
+    """
+    Records wall time, memory and item counts of the stages of a script.
+    A stage can run several times (e.g. once per experiment): its runs are summed.
+
+    The change of resident memory across each stage is always recorded, as is
+    the process high-water mark at its end. Both are cheap, and both include
+    NumPy buffers but not the memory of worker processes.
+    Optionally, the peak memory of a stage is the highest amount traced by
+    tracemalloc during the stage: tracing slows down allocation-heavy code
+    (e.g. drawing charts) several times, so it is only enabled while the
+    selected stages run.
+    """
+
+    def __init__(self, traceMemory=False):
+        """
+        Parameters
+        ----------
+        traceMemory : bool or list of str
+            trace allocations to measure the peak memory of every stage (True)
+            or of the listed stages only
+        """
+        self.traceMemory = traceMemory
+        self.stages = {}
+        self.current = None
+
+    def traced(self, name):
+        return self.traceMemory is True or (bool(self.traceMemory) and name in self.traceMemory)
+
+    def start(self, name, items=None):
+        """
+        Starts a stage, stopping the running one.
+
+        Parameters
+        ----------
+        name : str
+            name of the stage
+        items : int, optional
+            number of items (files, charts...) processed by the stage
+        """
+        self.stop()
+        traced = self.traced(name)
+        # tracing may have been started by someone else, it is then left running
+        startedTracing = traced and not tracemalloc.is_tracing()
+        if startedTracing:
+            tracemalloc.start()
+        elif traced:
+            tracemalloc.reset_peak()
+        self.current = (name, items, time.perf_counter(), tracemalloc.get_traced_memory()[0] if traced else None, startedTracing, currentRss())
+
+    def stop(self, items=None):
+        """
+        Stops the running stage, if any, and records its measures.
+
+        Parameters
+        ----------
+        items : int, optional
+            number of processed items, if not known when the stage started
+        """
+        if self.current is None:
+            return
+        name, startItems, start, memoryBefore, startedTracing, rssBefore = self.current
+        items = startItems if items is None else items
+        self.current = None
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] - memoryBefore if memoryBefore is not None else None
+        if startedTracing:
+            tracemalloc.stop()
+        rssAfter = currentRss()
+        stage = self.stages.setdefault(name, {'seconds': 0.0, 'peakMemory': None, 'rssDelta': None, 'maxRss': None, 'items': None, 'runs': 0})
+        stage['seconds'] += seconds
+        stage['runs'] += 1
+        if peak is not None:
+            stage['peakMemory'] = max(stage['peakMemory'] or 0, peak)
+        if rssBefore is not None and rssAfter is not None:
+            stage['rssDelta'] = max(stage['rssDelta'], rssAfter - rssBefore) if stage['rssDelta'] is not None else rssAfter - rssBefore
+        stage['maxRss'] = maxRss()
+        if items is not None:
+            stage['items'] = (stage['items'] or 0) + items
+
+    @contextmanager
+    def stage(self, name, items=None):
+        """
+        Measures the enclosed block as a stage.
+
+        Parameters
+        ----------
+        name : str
+            name of the stage
+        items : int, optional
+            number of items processed by the stage
+        """
+        self.start(name, items)
+        try:
+            yield
+        finally:
+            self.stop()
+
+    def summary(self):
+        """
+        Formats the recorded stages as a table.
+
+        Returns
+        -------
+        str
+            One line per stage, in order of first execution
+        """
+        def mb(value):
+            return '{:10.1f}'.format(value / 2**20) if value is not None else '{:>10}'.format('-')
+        lines = ['{:<20}{:>10}{:>8}{:>8}{:>10}{:>10}{:>10}'.format('stage', 'seconds', 'runs', 'items', 'peak MB', 'rss +MB', 'rss MB')]
+        for name, stage in self.stages.items():
+            items = stage['items'] if stage['items'] is not None else '-'
+            lines.append('{:<20}{:10.3f}{:>8}{:>8}'.format(name, stage['seconds'], stage['runs'], items) + mb(stage['peakMemory']) + mb(stage['rssDelta']) + mb(stage['maxRss']))
+        lines.append('{:<20}{:10.3f}'.format('total', sum(stage['seconds'] for stage in self.stages.values())))
+        return '\n'.join(lines)
+
+    def save(self, path):
+        """
+        Writes the recorded stages as JSON, memory in bytes.
+
+        Parameters
+        ----------
+        path : str
+            path to the report
+        """
+        with open(path, 'w') as file:
+            json.dump({'stages': self.stages, 'traceMemory': self.traceMemory}, file, indent=2)
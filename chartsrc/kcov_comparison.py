@@ -1,142 +1,389 @@
+import os
+import matplotlib
 import matplotlib.pyplot as plt
+import numpy as np
+import xarray as xr
 from math import ceil, sqrt
+from mpl_toolkits.mplot3d import Axes3D # unused, but importing it registers the '3d' projection of surfacesFigure
+
+from chartsrc.chartdata import selectBlock, surfaceData, timeLimitIndex
+
+def noOdds(lst): # replaces odds numbers in lst with empty strings
+    return list(map(lambda x: x if round(x * 10, 0) % 2 == 0 else '', lst))
+
+# Chart family -> (layout key, figure, artists) of the last figure drawn in this process
+figureLayouts = {}
+
+def reusedLayout(family, key, build):
+    """
+    Gets the figure of a chart family, building it only when its layout changes.
+    Figures of a family that share the key only differ in their data, which is
+    updated in place: the previous figure of a different layout is closed, as
+    are the figures of the other families, which are drawn one at a time.
+
+    Parameters
+    ----------
+    family : str
+        name of the chart family
+    key : str
+        everything but the data that affects the figure
+    build : callable
+        draws the figure, returning it and its artists
+
+    Returns
+    -------
+    tuple
+        The figure, its artists and whether it was just built
+    """
+    cached = figureLayouts.get(family)
+    if cached is not None and cached[0] == key:
+        return cached[1], cached[2], False
+    releaseLayouts()
+    fig, artists = build()
+    figureLayouts[family] = (key, fig, artists)
+    return fig, artists, True
+
+def releaseLayouts():
+    """
+    Closes the figures kept by reusedLayout, once their chart families are drawn.
+    """
+    for key, fig, artists in figureLayouts.values():
+        plt.close(fig)
+    figureLayouts.clear()
+
+def updateErrorSegments(barLines, xs, values, errors):
+    # vertical error bars, missing ends are left out as matplotlib does when drawing them
+    barLines.set_segments([np.array([(x, y) for y in (value - error, value + error) if not np.isnan(y)]).reshape(-1, 2)
+                           for x, value, error in zip(xs, values, errors)])
+
+def updateBars(bars, values, errors):
+    for rect, value in zip(bars.patches, values):
+        rect.set_height(value)
+    dataLine, caps, (barLines,) = bars.errorbar.lines
+    updateErrorSegments(barLines, [rect.get_x() + 0.5 * rect.get_width() for rect in bars.patches], values, errors)
+    if caps: # lower and upper caps
+        caps[0].set_ydata(values - errors)
+        caps[1].set_ydata(values + errors)
 
 class KcovChartBuilder:
-    def __init__(self, charts_dir, dataKcovsMean, dataKcovsStd, algos, labels):
+    def __init__(self, charts_dir, dataKcovsMean, dataKcovsStd, algos, labels, previewDpi=None, fullCharts=(), pool=None, manifest=None):
         self.charts_dir = charts_dir
         self.dataKcovsMean = dataKcovsMean
         self.dataKcovsStd = dataKcovsStd
         self.algos = algos
         self.labels = labels
+        self.previewDpi = previewDpi # charts are PNG previews at this resolution, None for PDFs
+        self.fullCharts = fullCharts # names of the charts still drawn as PDF in preview mode
+        self.pool = pool
+        self.manifest = manifest
+
+    def constructorArgs(self):
+        # the workers only draw the inputs extracted here, they do not need the datasets
+        return (self.charts_dir, None, None, self.algos, self.labels, self.previewDpi, self.fullCharts)
+
+    def outputPath(self, path):
+        name, extension = os.path.splitext(path)
+        if self.previewDpi is None or os.path.basename(name) in self.fullCharts:
+            return path
+        return name + '.png'
+
+    def save(self, fig, path):
+        if path.endswith('.png'):
+            fig.savefig(path, dpi=self.previewDpi)
+        else:
+            fig.savefig(path)
+
+    def render(self, figure, *args):
+        # Every figure is independent: its inputs are extracted here, then it is drawn now
+        # or by the pool of workers, unless the manifest shows that its file is up to date
+        path, inputs = getattr(self, figure + 'Inputs')(*args)
+        # figures only draw their inputs, the datasets they come from are left out of the task
+        drawArgs = tuple(None if isinstance(a, xr.Dataset) else a for a in args)
+        path = self.outputPath(path)
+        done = None
+        if self.manifest is not None:
+            l = self.labels
+            fingerprint = self.manifest.fingerprint(figure, args, inputs, (self.algos, l.colors, l.errColors, l.variables, l.legends, self.previewDpi))
+            if self.manifest.upToDate(path, fingerprint):
+                return
+            done = lambda: self.manifest.record(path, fingerprint)
+        if self.pool is None:
+            getattr(self, figure)(path, inputs, *drawArgs)
+            if done is not None:
+                done()
+        else:
+            self.pool.submit(self, figure, (path, inputs) + drawArgs, done)
 
     def compare(self, columns, fixesData, variableData, fancyTitle='', precision=0):
         if(fancyTitle == ''):
             fancyTitle = columns[2]
+        for r,fixedD in enumerate(fixesData):
+            self.render('compareFigure', columns, fixedD, variableData, fancyTitle, precision)
+
+    def compareFigureInputs(self, columns, fixedD, variableData, fancyTitle, precision):
         l = self.labels
+        # (variable, variableD, algorithm) blocks of the whole figure
+        selection = dict(zip(columns, (self.algos, fixedD, list(variableData))))
+        path = self.charts_dir + 'KCov_compare_' + str(columns[1]) + '-' + str(fixedD) + '_' + str(columns[2]) + '_variable.pdf'
+        return path, {
+            'means': selectBlock(self.dataKcovsMean, l.variables, selection, [columns[2], columns[0]]),
+            'stds': selectBlock(self.dataKcovsStd, l.variables, selection, [columns[2], columns[0]]),
+        }
 
-        for r,fixedD in enumerate(fixesData):
-            fig = plt.figure(figsize=(14,10))
-            for j,variableD in enumerate(variableData):
-                # rows, columns, index
-                size = ceil(sqrt(len(variableData)))
-                rows = size
-                cols = size
-                ax = fig.add_subplot(rows, cols,j+1)
-                ax.set_ylim([0,1])
-                ax.set_title(fancyTitle + " = {0:.{1}f}".format(variableD, precision))
-                if j%cols == 0:
-                    ax.set_ylabel("Coverage (%)")
-                plt.xticks(rotation=35, ha='right')
-                ax.yaxis.grid(True)
-
-                for i,s in enumerate(l.variables):
-                    kwargs_arr = [dict(zip(columns, (algoname, fixedD, variableD))) for algoname in self.algos]
-                    values = [self.dataKcovsMean[s].sel(**kwargs).values.tolist() for kwargs in kwargs_arr]
-                    errors = [self.dataKcovsStd[s].sel(**kwargs).values.tolist() for kwargs in kwargs_arr]
-                    ax.bar(self.algos, values, yerr=errors, label=l.legends[i], capsize=4, color=l.colors[i], ecolor=l.errColors[i])
-                if j == cols-1:
-                    ax.legend()
-            plt.tight_layout()
-            fig.savefig(self.charts_dir + 'KCov_compare_' + str(columns[1]) + '-' + str(fixedD) + '_' + str(columns[2]) + '_variable.pdf')
-            plt.close(fig)
+    def compareFigure(self, path, inputs, columns, fixedD, variableData, fancyTitle, precision):
+        l = self.labels
+        key = repr((columns, list(variableData), fancyTitle, precision, list(self.algos), l.variables, l.legends, l.colors, l.errColors))
+        fig, artists, built = reusedLayout('compare', key, lambda: self.compareLayout(inputs, variableData, fancyTitle, precision))
+        if not built:
+            for (j, i), bars in artists.items():
+                updateBars(bars, inputs['means'][i, j], inputs['stds'][i, j])
+        self.save(fig, path)
+
+    def compareLayout(self, inputs, variableData, fancyTitle, precision):
+        l = self.labels
+        artists = {}
+        fig = plt.figure(figsize=(14,10))
+        for j,variableD in enumerate(variableData):
+            # rows, columns, index
+            size = ceil(sqrt(len(variableData)))
+            rows = size
+            cols = size
+            ax = fig.add_subplot(rows, cols,j+1)
+            ax.set_ylim([0,1])
+            ax.set_title(fancyTitle + " = {0:.{1}f}".format(variableD, precision))
+            if j%cols == 0:
+                ax.set_ylabel("Coverage (%)")
+            plt.xticks(rotation=35, ha='right')
+            ax.yaxis.grid(True)
+
+            for i,s in enumerate(l.variables):
+                values = inputs['means'][i, j]
+                errors = inputs['stds'][i, j]
+                artists[(j, i)] = ax.bar(self.algos, values, yerr=errors, label=l.legends[i], capsize=4, color=l.colors[i], ecolor=l.errColors[i])
+            if j == cols-1:
+                ax.legend()
+        plt.tight_layout()
+        return fig, artists
 
 
     def lines(self, columns, fixesData, variableData, variableColumName, fancyLabel, precision=0):
-        l = self.labels
         for fixedD in fixesData:
-            fig = plt.figure(figsize=(14,10))
-            for idx,algo in enumerate(self.algos):
-                cols = 2
-                rows = ceil(len(self.algos) /cols)
-                ax = fig.add_subplot(rows,cols,idx+1)
-                minRange = min(variableData) - 0.1
-                maxRange = max(variableData) + 0.1
-                ax.set_ylim([0,1])
-                ax.set_xlim([minRange, maxRange])
-                plt.xticks(rotation=35, ha='right')
-                if idx%cols == 0:
-                    ax.set_ylabel("Coverage (%)")
-                if idx >= len(self.algos) - rows:
-                    ax.set_xlabel(fancyLabel)
-                if idx%rows != 0:
-                    ax.set_yticklabels([])
-                ax.set_title(algo)
-                ax.set_xticks([minRange] + variableData + [maxRange])
-                ax.set_xticklabels([""] + ["{0:.{1}f}".format(c, precision) for c in variableData] + [""])
-
-                kwargs = dict(zip(columns, (algo, fixedD)))
-
-                chartdataMean = self.dataKcovsMean.sel(**kwargs)
-                chartdataStd = self.dataKcovsStd.sel(**kwargs)
-                for i,s in enumerate(l.variables):
-                    values = chartdataMean[s].values.tolist()
-                    errors = chartdataStd[s].values.tolist()
-                    ax.plot(variableData, values, label=l.legends[i], color=l.colors[i])
-                    for j,r in enumerate(variableData):
-                        ax.errorbar(r, values[j], yerr=errors[j], fmt='', color=l.colors[i], elinewidth=1, capsize=0)
-                if idx == cols-1:
-                    ax.legend()
-            plt.tight_layout()
-            fig.savefig(self.charts_dir + 'KCov_lines_' + variableColumName + '-variable_'+ str(columns[1]) + "-" +str(fixedD)+'.pdf')
-            plt.close(fig)
+            self.render('linesFigure', columns, fixedD, variableData, variableColumName, fancyLabel, precision)
+
+    def linesFigureInputs(self, columns, fixedD, variableData, variableColumName, fancyLabel, precision):
+        l = self.labels
+        # (variable, algorithm, variableD) blocks of the whole figure, the variable dimension is the one not fixed
+        variableDim = next(d for d in self.dataKcovsMean[l.variables[0]].dims if d not in columns)
+        selection = {columns[0]: self.algos, columns[1]: fixedD, variableDim: list(variableData)}
+        path = self.charts_dir + 'KCov_lines_' + variableColumName + '-variable_'+ str(columns[1]) + "-" +str(fixedD)+'.pdf'
+        return path, {
+            'means': selectBlock(self.dataKcovsMean, l.variables, selection, [columns[0], variableDim]),
+            'stds': selectBlock(self.dataKcovsStd, l.variables, selection, [columns[0], variableDim]),
+        }
+
+    def linesFigure(self, path, inputs, columns, fixedD, variableData, variableColumName, fancyLabel, precision):
+        l = self.labels
+        key = repr((list(variableData), fancyLabel, precision, list(self.algos), l.variables, l.legends, l.colors))
+        fig, artists, built = reusedLayout('lines', key, lambda: self.linesLayout(inputs, variableData, fancyLabel, precision))
+        if not built:
+            for (idx, i), (line, errorbars) in artists.items():
+                values = inputs['means'][i, idx]
+                errors = inputs['stds'][i, idx]
+                line.set_ydata(values)
+                for j, r in enumerate(variableData):
+                    dataLine, caps, (barLines,) = errorbars[j].lines
+                    dataLine.set_data([r], [values[j]])
+                    updateErrorSegments(barLines, [r], values[j:j+1], errors[j:j+1])
+        self.save(fig, path)
+
+    def linesLayout(self, inputs, variableData, fancyLabel, precision):
+        l = self.labels
+        artists = {}
+        fig = plt.figure(figsize=(14,10))
+        for idx,algo in enumerate(self.algos):
+            cols = 2
+            rows = ceil(len(self.algos) /cols)
+            ax = fig.add_subplot(rows,cols,idx+1)
+            minRange = min(variableData) - 0.1
+            maxRange = max(variableData) + 0.1
+            ax.set_ylim([0,1])
+            ax.set_xlim([minRange, maxRange])
+            plt.xticks(rotation=35, ha='right')
+            if idx%cols == 0:
+                ax.set_ylabel("Coverage (%)")
+            if idx >= len(self.algos) - rows:
+                ax.set_xlabel(fancyLabel)
+            if idx%rows != 0:
+                ax.set_yticklabels([])
+            ax.set_title(algo)
+            ax.set_xticks([minRange] + variableData + [maxRange])
+            ax.set_xticklabels([""] + ["{0:.{1}f}".format(c, precision) for c in variableData] + [""])
+
+            for i,s in enumerate(l.variables):
+                values = inputs['means'][i, idx]
+                errors = inputs['stds'][i, idx]
+                line, = ax.plot(variableData, values, label=l.legends[i], color=l.colors[i])
+                errorbars = []
+                for j,r in enumerate(variableData):
+                    errorbars.append(ax.errorbar(r, values[j], yerr=errors[j], fmt='', color=l.colors[i], elinewidth=1, capsize=0))
+                artists[(idx, i)] = (line, errorbars)
+            if idx == cols-1:
+                ax.legend()
+        plt.tight_layout()
+        return fig, artists
 
 
     def inTime(self, columns, kcovTypes, dataInTime, fixedType, variableTypes, timeLimit, name = ''):
         for whichKCov in kcovTypes:
-            rows = 2
-            cols = 2
-            fig, axes = plt.subplots(rows, cols, figsize=(12,8), sharex='col', sharey='row')
-            for idx, variableType in enumerate(variableTypes):
-                r = int(idx / cols)
-                c = int(idx % cols)
-
-                kwargs = dict(zip(columns, (self.algos, fixedType, variableType)))
-
-                xdata = dataInTime.sel(**kwargs)['time']
-                ydata = dataInTime.sel(**kwargs)[whichKCov].transpose()
-                timeLimitIdx = next((i for i,x in enumerate(xdata) if x >= timeLimit)) # first idx of time > timeLimit
-                xdata = xdata[:timeLimitIdx]
-                ydata = ydata[:timeLimitIdx]
-
-                axes[r][c].plot(xdata, ydata)
-                axes[r][c].set_title('n/m = ' + variableType)
-                axes[r][c].set_ylim([0,1])
-                if c == 0:
-                    axes[r][c].set_ylabel(whichKCov + ' (%)')
-                if r == rows-1:
-                    axes[r][c].set_xlabel('t')
-                if r == 0 and c == cols -1:
-                    axes[r][c].legend(ydata.coords['Algorithm'].data.tolist())
-            fig.savefig(self.charts_dir + whichKCov + "_" + name + '_InTime.pdf')
-            plt.close(fig)
-    
+            self.render('inTimeFigure', columns, whichKCov, dataInTime, fixedType, variableTypes, timeLimit, name)
+
+    def inTimeFigureInputs(self, columns, whichKCov, dataInTime, fixedType, variableTypes, timeLimit, name):
+        timeLimitIdx = timeLimitIndex(dataInTime['time'].values, timeLimit) # first idx of time >= timeLimit
+        ydata = []
+        for variableType in variableTypes:
+            selection = dict(zip(columns, (self.algos, fixedType, variableType)))
+            ydata.append(selectBlock(dataInTime, [whichKCov], selection, ['time', columns[0]])[0, :timeLimitIdx])
+        path = self.charts_dir + whichKCov + "_" + name + '_InTime.pdf'
+        return path, {'xdata': dataInTime['time'].values[:timeLimitIdx], 'ydata': ydata}
+
+    def inTimeFigure(self, path, inputs, columns, whichKCov, dataInTime, fixedType, variableTypes, timeLimit, name):
+        rows = 2
+        cols = 2
+        fig, axes = plt.subplots(rows, cols, figsize=(12,8), sharex='col', sharey='row')
+        for idx, variableType in enumerate(variableTypes):
+            r = int(idx / cols)
+            c = int(idx % cols)
+
+            axes[r][c].plot(inputs['xdata'], inputs['ydata'][idx])
+            axes[r][c].set_title('n/m = ' + variableType)
+            axes[r][c].set_ylim([0,1])
+            if c == 0:
+                axes[r][c].set_ylabel(whichKCov + ' (%)')
+            if r == rows-1:
+                axes[r][c].set_xlabel('t')
+            if r == 0 and c == cols -1:
+                axes[r][c].legend(list(self.algos))
+        self.save(fig, path)
+        plt.close(fig)
+
     def inTimeByValue(self, columns, kcovTypes, dataInTime, fixedType, variableTypes, timeLimit, name = '', unit=''):
         for whichKCov in kcovTypes:
-            rows = 1
+            self.render('inTimeByValueFigure', columns, whichKCov, dataInTime, fixedType, variableTypes, timeLimit, name, unit)
+
+    def inTimeByValueFigureInputs(self, columns, whichKCov, dataInTime, fixedType, variableTypes, timeLimit, name, unit):
+        timeLimitIdx = timeLimitIndex(dataInTime['time'].values, timeLimit) # first idx of time >= timeLimit
+        ydata = []
+        for algorithm in self.algos:
+            selection = dict(zip(columns, (algorithm, fixedType, list(variableTypes))))
+            ydata.append(selectBlock(dataInTime, [whichKCov], selection, ['time', columns[2]])[0, :timeLimitIdx])
+        path = self.charts_dir + whichKCov + "_" + columns[1] + "-" + str(fixedType) + "_" + name + '_InTime.pdf'
+        return path, {
+            'xdata': dataInTime['time'].values[:timeLimitIdx],
+            'ydata': ydata,
+            'values': dataInTime[columns[2]].sel({columns[2]: list(variableTypes)}).values,
+        }
+
+    def inTimeByValueFigure(self, path, inputs, columns, whichKCov, dataInTime, fixedType, variableTypes, timeLimit, name, unit):
+        rows = 1
+        cols = 2
+        fig, axes = plt.subplots(rows, cols, figsize=(10,5), sharex='col', sharey='row')
+        axes = [axes] # COMMENT in case rows > 1
+        for idx, algorithm in enumerate(self.algos):
+            r = int(idx / cols)
+            c = int(idx % cols)
+
+            axes[r][c].plot(inputs['xdata'], inputs['ydata'][idx])
+            axes[r][c].set_title(algorithm)
+            axes[r][c].set_ylim([0,1])
+            if c == 0:
+                axes[r][c].set_ylabel(whichKCov + ' (%)')
+            if r == rows-1:
+                axes[r][c].set_xlabel('t')
+            if r == 0 and c == cols -1:
+                legend_labels = [f"{value} " + unit for value in inputs['values'].tolist()]
+                axes[r][c].legend(legend_labels)
+        self.save(fig, path)
+        plt.close(fig)
+
+    def surfaces(self, herdNumbers, simRatios):
+        self.render('surfacesFigure', herdNumbers, simRatios)
+
+    def surfacesFigureInputs(self, herdNumbers, simRatios):
+        l = self.labels
+        forKcovVars = [l.variables[0], l.variables[-1]]
+        # one (x, y, z) surface per algorithm and plotted variable, None for the others
+        surfaces = [[surfaceData(self.dataKcovsMean[whichKCov].sel(Algorithm=algo), 'NumberOfHerds', 'CamHerdRatio') if whichKCov in forKcovVars else None
+                     for whichKCov in l.variables] for algo in self.algos]
+        return self.charts_dir + 'KCov_3D.pdf', {'surfaces': surfaces}
+
+    def surfacesFigure(self, path, inputs, herdNumbers, simRatios):
+        l = self.labels
+        fig = plt.figure(figsize=(12,16))
+        for idx, algo in enumerate(self.algos):
             cols = 2
-            fig, axes = plt.subplots(rows, cols, figsize=(10,5), sharex='col', sharey='row')
-            axes = [axes] # COMMENT in case rows > 1
-            for idx, algorithm in enumerate(self.algos):
-                r = int(idx / cols)
-                c = int(idx % cols)
-
-                kwargs = dict(zip(columns, (algorithm, fixedType, variableTypes)))
-
-                xdata = dataInTime.sel(**kwargs)['time']
-                ydata = dataInTime.sel(**kwargs)[whichKCov].transpose()
-                timeLimitIdx = next((i for i,x in enumerate(xdata) if x >= timeLimit)) # first idx of time > timeLimit
-                xdata = xdata[:timeLimitIdx]
-                ydata = ydata[:timeLimitIdx]
-
-                axes[r][c].plot(xdata, ydata)
-                axes[r][c].set_title(algorithm)
-                axes[r][c].set_ylim([0,1])
-                if c == 0:
-                    axes[r][c].set_ylabel(whichKCov + ' (%)')
-                if r == rows-1:
-                    axes[r][c].set_xlabel('t')
-                if r == 0 and c == cols -1:
-                    legend_labels = [f"{value} " + unit for value in ydata.coords[columns[2]].data.tolist()]
-                    axes[r][c].legend(legend_labels)
-            fig.savefig(self.charts_dir + whichKCov + "_" + columns[1] + "-" + str(fixedType) + "_" + name + '_InTime.pdf')
-            plt.close(fig)
\ No newline at end of file
+            rows = ceil(len(self.algos) / 2)
+            ax = fig.add_subplot(rows,cols,idx+1, projection='3d')
+
+            #ax.tick_params(labelsize=labelsize)
+            ax.set_xlabel("m")
+            ax.set_ylabel("n/m")
+            if idx%cols == cols-1:
+                ax.set_zlabel("Coverage (%)")
+            #else:
+            #    ax.set_zticklabels([])
+            ax.set_xlim([max(herdNumbers),min(herdNumbers)])
+            ax.set_ylim([min(simRatios),max(simRatios)])
+            ax.set_zlim([0,1])
+            ax.set_title(algo)
+
+            fakeLinesForLegend = []
+            forKcovTrans = []
+            for k, whichKCov in enumerate(l.variables):
+                if inputs['surfaces'][idx][k] is None:
+                    continue
+                x,y,z = inputs['surfaces'][idx][k]
+                ax.plot_trisurf(x,y,z, linewidth=2, antialiased=False, shade=True, alpha=0.5, color=l.colors[k])
+                fakeLinesForLegend.append(matplotlib.lines.Line2D([0],[0], linestyle='none', c=l.colors[k], marker='o'))
+                forKcovTrans.append(l.legends[k])
+            if idx == cols-1:
+                ax.legend(fakeLinesForLegend, forKcovTrans, numpoints=1)
+
+        plt.tight_layout()
+        self.save(fig, path)
+        plt.close(fig)
+
+    def heatmaps(self, simRatios, herdNumbers):
+        for whichKCov in self.labels.variables:
+            self.render('heatmapFigure', whichKCov, simRatios, herdNumbers)
+
+    def heatmapFigureInputs(self, whichKCov, simRatios, herdNumbers):
+        # (algorithm, herd number, ratio) block, herd numbers on the rows and ratios on the columns, as the tick labels
+        data = selectBlock(self.dataKcovsMean, [whichKCov], {'Algorithm': self.algos}, ['Algorithm', 'NumberOfHerds', 'CamHerdRatio'])[0]
+        return self.charts_dir + whichKCov + '_heatmap.pdf', {'data': data}
+
+    def heatmapFigure(self, path, inputs, whichKCov, simRatios, herdNumbers):
+        import seaborn as sns
+        rows = 4
+        cols = 2
+        gridspec_kw={'width_ratios': [1,1,0.05], 'height_ratios': [1,1,1,1]}
+        fig, axes = plt.subplots(rows, cols+1, figsize=(8,10), sharex='col', gridspec_kw=gridspec_kw)
+        plt.xlim([min(simRatios), max(simRatios)])
+        plt.ylim([0,1])
+        for idx,algo in enumerate(self.algos):
+            r = int(idx / cols)
+            c = int(idx % cols)
+            cbar = idx%cols == cols - 1 # only charts to the right have the bar
+            ax = sns.heatmap(inputs['data'][idx], vmin=0, vmax=1, ax=axes[r][c], cbar=cbar, cbar_ax=axes[r][cols], cbar_kws={'label': whichKCov + ' (%)'})
+            if idx%cols == 0:
+                ax.set_ylabel('r')
+                ax.set_yticklabels([str(int(x)) for x in herdNumbers])
+            else:
+                ax.set_yticklabels([])
+            if idx >= cols * (rows - 1):
+                ax.set_xlabel('n/m')
+                ax.set_xticklabels(noOdds(simRatios))
+
+            ax.invert_yaxis()
+            ax.set_title(algo)
+        self.save(fig, path)
+        plt.close(fig)
@@ -0,0 +1,312 @@
+import hashlib
+import json
+import os
+import warnings
+import numpy as np
+import xarray as xr
+
+from chartsrc.store import saveDataset, openDataset
+
+# Statistics computed from the running moments, quantiles are requested separately
+momentStatistics = ('count', 'sum', 'mean', 'std', 'sem', 'min', 'max')
+
+def trailing(values, axes):
+    # moves the axes to the end and flattens them into the last one
+    values = np.moveaxis(values, axes, list(range(values.ndim - len(axes), values.ndim)))
+    return values.reshape(values.shape[:values.ndim - len(axes)] + (-1,))
+
+def dataMoments(values, axes, extra=('m2', 'min', 'max')):
+    """
+    Computes the moments of an array over some of its axes, NaN being missing values.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        the data
+    axes : list of int
+        the axes to reduce
+    extra : list of str
+        moments needed besides count and mean, among m2 (sum of squared
+        deviations from the mean), min and max
+
+    Returns
+    -------
+    dict
+        count, mean and the extra moments, each an array over the remaining axes
+    """
+    values = trailing(values.astype(np.float64, copy=False), axes)
+    missing = np.isnan(values)
+    hasMissing = missing.any()
+    filled = np.where(missing, 0, values) if hasMissing else values
+    count = values.shape[-1] - missing.sum(axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        moments = {'count': count, 'mean': filled.sum(axis=-1) / count}
+        if 'm2' in extra:
+            deviations = filled - moments['mean'][..., None]
+            if hasMissing:
+                deviations[missing] = 0
+            moments['m2'] = np.einsum('...i,...i->...', deviations, deviations)
+    if 'min' in extra:
+        moments['min'] = np.fmin.reduce(values, axis=-1)
+    if 'max' in extra:
+        moments['max'] = np.fmax.reduce(values, axis=-1)
+    return moments
+
+def mergeMoments(moments, axes):
+    """
+    Combines the moments of groups over some of their axes, as if they were
+    computed on the union of the groups (Chan et al. pairwise update).
+
+    Parameters
+    ----------
+    moments : dict
+        moments as returned by dataMoments
+    axes : list of int
+        the axes of the groups to merge
+
+    Returns
+    -------
+    dict
+        The same moments over the remaining axes
+    """
+    count, mean = (trailing(moments[k], axes) for k in ('count', 'mean'))
+    total = count.sum(axis=-1)
+    filled = np.where(count > 0, mean, 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        merged = {'count': total, 'mean': (count * filled).sum(axis=-1) / total}
+        if 'm2' in moments:
+            spread = np.where(count > 0, filled - merged['mean'][..., None], 0)
+            merged['m2'] = trailing(moments['m2'], axes).sum(axis=-1) + (count * spread * spread).sum(axis=-1)
+    if 'min' in moments:
+        merged['min'] = np.fmin.reduce(trailing(moments['min'], axes), axis=-1)
+    if 'max' in moments:
+        merged['max'] = np.fmax.reduce(trailing(moments['max'], axes), axis=-1)
+    return merged
+
+def finishMoments(moments, statistic, ddof=0):
+    count, mean = moments['count'], moments['mean']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if statistic == 'count':
+            return count.astype(np.float64)
+        if statistic == 'sum':
+            return np.where(count > 0, mean * count, 0.0) # empty sums are zero, as in xarray
+        if statistic == 'mean':
+            return mean
+        if statistic in ('std', 'sem'):
+            std = np.where(count > ddof, np.sqrt(moments['m2'] / (count - ddof)), np.nan)
+            return std if statistic == 'std' else std / np.sqrt(count)
+    return moments[statistic]
+
+def quantileLabel(q):
+    return 'q' + str(q)
+
+def groupedName(grouping, variable):
+    # name of a variable of one of the groupings computed by a single statistics step
+    return grouping + ':' + variable
+
+def aggregateStatistics(dataset, groupings, statistics=('mean', 'std'), quantiles=(), ddof=0):
+    """
+    Computes several statistics for several groupings of a dataset, reading
+    each variable once.
+    Every grouping reduces a set of dimensions (the others are the groups).
+    The moments of the smallest groupings are computed from the data, larger
+    groupings merge the moments of a grouping they contain instead of reading
+    the data again: e.g. reducing over Seed, then over Seed and
+    ClusteringDistance, walks the data once. Quantiles cannot be merged and
+    are computed from the data of each grouping.
+
+    Parameters
+    ----------
+    dataset : xarray.Dataset
+        the data, possibly lazily-loaded
+    groupings : dict
+        name of the grouping to the list of dimensions it reduces
+    statistics : list of str
+        among count, sum, mean, std, sem (standard error of the mean), min and max
+    quantiles : list of float
+        quantiles to compute as well, in [0, 1]
+    ddof : int
+        delta degrees of freedom of std and sem
+
+    Returns
+    -------
+    dict
+        Name of the grouping to a Dataset with the same variables, whose
+        values are indexed by a statistic dimension (the statistics, then
+        'q' + str(quantile) for the quantiles) followed by the remaining
+        dimensions
+
+    """
+    unknown = [s for s in statistics if s not in momentStatistics]
+    if unknown:
+        raise ValueError("Unknown statistics " + str(unknown))
+    labels = list(statistics) + [quantileLabel(q) for q in quantiles]
+    extra = [m for m, needed in (('m2', ('std', 'sem')), ('min', ('min',)), ('max', ('max',))) if set(needed) & set(statistics)]
+    # Smaller groupings first, so that larger ones can be derived from them
+    order = sorted(groupings, key=lambda name: len(groupings[name]))
+    results = {name: {} for name in groupings}
+    for variable in dataset.data_vars:
+        array = dataset[variable]
+        values = None
+        moments = {}
+        for name in order:
+            reduced = frozenset(d for d in groupings[name] if d in array.dims)
+            kept = [d for d in array.dims if d not in reduced]
+            source = max((g for g in moments if g <= reduced), key=len, default=None)
+            if source is None:
+                if values is None:
+                    values = array.values
+                moments[reduced] = dataMoments(values, [array.dims.index(d) for d in reduced], extra)
+            elif source != reduced:
+                sourceDims = [d for d in array.dims if d not in source]
+                moments[reduced] = mergeMoments(moments[source], [sourceDims.index(d) for d in reduced - source])
+            blocks = [finishMoments(moments[reduced], s, ddof) for s in statistics]
+            if quantiles:
+                if values is None:
+                    values = array.values
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore', RuntimeWarning) # all-NaN groups
+                    flat = trailing(values.astype(np.float64, copy=False), [array.dims.index(d) for d in reduced])
+                    blocks.extend(np.nanquantile(flat, list(quantiles), axis=-1))
+            results[name][variable] = xr.DataArray(np.stack(blocks), dims=['statistic'] + kept,
+                                                   coords={d: array.coords[d] for d in kept if d in array.coords})
+    return {name: xr.Dataset(variables, coords={'statistic': labels}, attrs=dataset.attrs) for name, variables in results.items()}
+
+def applyReduction(dataset, operation):
+    """
+    Applies a single step of a reduction spec.
+
+    Parameters
+    ----------
+    dataset : xarray.Dataset
+        the dataset to reduce
+    operation : tuple
+        one of ('sel', {dim: values}), ('mean', dim), ('std', dim), ('sum', dim),
+        ('statistics', dims, statistics[, quantiles]), which computes all the
+        statistics over the dimensions in a single pass (see
+        aggregateStatistics), ('statistics', {grouping: dims}, statistics[,
+        quantiles]), which computes them for several groupings in the same
+        pass, then ('grouping', name) picks the result of one of them, or
+        ('ratio', name, numerator, denominator), which adds the variable name
+        as the ratio of two variables.
+        Reductions accumulate and return float64 values whatever the type of
+        the dataset.
+
+    Returns
+    -------
+    xarray.Dataset
+        The reduced dataset
+
+    """
+    kind, *args = operation
+    if kind == 'sel':
+        return dataset.sel(**args[0])
+    if kind in ('mean', 'std', 'sum'):
+        return getattr(dataset, kind)(args[0], dtype=np.float64)
+    if kind == 'statistics':
+        dims, statistics, *quantiles = args
+        if isinstance(dims, dict):
+            # the variables of every grouping in one dataset, told apart by the name of their grouping
+            results = aggregateStatistics(dataset, dims, statistics, *quantiles)
+            return xr.merge([result.rename({v: groupedName(grouping, v) for v in result.data_vars}) for grouping, result in results.items()],
+                            combine_attrs='override')
+        return aggregateStatistics(dataset, {kind: dims}, statistics, *quantiles)[kind]
+    if kind == 'grouping':
+        prefix = groupedName(args[0], '')
+        names = [v for v in dataset.data_vars if v.startswith(prefix)]
+        return dataset[names].rename({v: v[len(prefix):] for v in names})
+    if kind == 'ratio':
+        name, numerator, denominator = args
+        return dataset.assign(**{name: dataset[numerator] / dataset[denominator]})
+    raise ValueError("Unknown reduction " + str(kind))
+
+def specKey(spec):
+    return json.dumps(spec, sort_keys=True, default=str)
+
+class AggregateCache:
+    """
+    Memoizes reductions of a dataset, on disk and in memory.
+    A reduction is described by a spec, a list of operations applied in order
+    (see applyReduction). Results are stored under the fingerprint of the
+    source dataset and the spec, so they are reused by later runs as long as
+    the source does not change. Within a run, the intermediate results of
+    common prefixes are computed once, with or without a directory.
+    """
+
+    def __init__(self, directory, dataset, fingerprint):
+        """
+        Parameters
+        ----------
+        directory : str
+            directory of the stored reductions, created if missing, None to
+            only memoize them in memory
+        dataset : xarray.Dataset
+            the source dataset, possibly lazily-loaded: it is read only on misses
+        fingerprint : str
+            identifier of the content of the source dataset
+        """
+        self.directory = directory
+        self.dataset = dataset
+        self.fingerprint = fingerprint
+        self.memory = {}
+        self.hits = 0
+        self.misses = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def path(self, spec):
+        key = hashlib.blake2b(specKey(spec).encode(), digest_size=16).hexdigest()
+        return os.path.join(self.directory, self.fingerprint[:32] + '_' + key + '.nc')
+
+    def get(self, spec, persist=True):
+        """
+        Gets a reduction, loading it or computing it from the longest available prefix.
+
+        Parameters
+        ----------
+        spec : list of tuple
+            the operations to apply to the source dataset
+        persist : bool
+            whether the result is stored on disk, if the cache has a directory
+
+        Returns
+        -------
+        xarray.Dataset
+            The reduced dataset, loaded in memory
+        """
+        spec = list(spec)
+        if not spec:
+            return self.dataset
+        persist = persist and self.directory is not None
+        key = specKey(spec)
+        if key in self.memory:
+            return self.memory[key]
+        path = self.path(spec) if persist else None
+        if persist and os.path.exists(path):
+            with openDataset(path) as stored:
+                result = stored.load()
+            self.hits += 1
+        else:
+            result = applyReduction(self.get(spec[:-1], persist=False), spec[-1])
+            if persist:
+                result = result.load()
+                saveDataset(path, result)
+                self.misses += 1
+        self.memory[key] = result
+        return result
+
+    def prune(self):
+        """
+        Removes the stored reductions of any other source dataset.
+
+        Returns
+        -------
+        int
+            The number of removed files
+        """
+        if self.directory is None:
+            return 0
+        stale = [name for name in os.listdir(self.directory) if name.endswith('.nc') and not name.startswith(self.fingerprint[:32] + '_')]
+        for name in stale:
+            os.remove(os.path.join(self.directory, name))
+        return len(stale)
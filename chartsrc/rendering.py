@@ -0,0 +1,248 @@
+import hashlib
+import html
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+import numpy as np
+import xarray as xr
+
+def initWorker():
+    import matplotlib
+    matplotlib.use('Agg')
+
+def renderTask(builderClass, builderArgs, figure, args):
+    builder = builderClass(*builderArgs)
+    getattr(builder, figure)(*args)
+
+class ChartPool:
+    """
+    Renders independent figures in a pool of worker processes.
+    Tasks only carry what the figure draws: the arrays extracted for it by the
+    caller and its parameters, never the datasets they were extracted from.
+    With a single worker the figures are drawn immediately in this process.
+    """
+
+    def __init__(self, workers=1, release=None):
+        """
+        Parameters
+        ----------
+        workers : int
+            number of worker processes, 1 to render in this process
+        release : callable, optional
+            frees what the figures drawn in this process keep once they are
+            saved (e.g. reused layouts), called without arguments by wait
+        """
+        self.workers = workers
+        self.release = release
+        self.executor = ProcessPoolExecutor(workers, initializer=initWorker) if workers > 1 else None
+        self.futures = []
+        self.callbacks = []
+
+    def submit(self, builder, figure, args, done=None):
+        """
+        Renders a figure of a chart builder.
+
+        Parameters
+        ----------
+        builder : object
+            the chart builder, rebuilt in the workers from its constructorArgs()
+        figure : str
+            name of the method of the builder drawing the figure
+        args : tuple
+            arguments of the method, sent to the workers as they are
+        done : callable, optional
+            called without arguments in this process once the figure is saved
+        """
+        if self.executor is None:
+            getattr(builder, figure)(*args)
+            if done is not None:
+                done()
+            return
+        self.futures.append(self.executor.submit(renderTask, type(builder), builder.constructorArgs(), figure, args))
+        self.callbacks.append(done)
+
+    def wait(self):
+        """
+        Waits for the submitted figures, raising the first error of the workers.
+        """
+        futures, self.futures = self.futures, []
+        callbacks, self.callbacks = self.callbacks, []
+        try:
+            for future, done in zip(futures, callbacks):
+                future.result()
+                if done is not None:
+                    done()
+        finally:
+            if self.release is not None:
+                self.release()
+
+    def close(self):
+        """
+        Waits for the submitted figures, then stops the workers.
+        """
+        try:
+            self.wait()
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown()
+
+class ChartManifest:
+    """
+    Remembers the fingerprint of the data and parameters each chart was drawn
+    from, so that a later run only redraws the charts whose inputs changed or
+    whose file is missing.
+    The manifest is only updated once a chart is saved: an interrupted run
+    redraws whatever it did not complete.
+    """
+
+    def __init__(self, path, force=False):
+        """
+        Parameters
+        ----------
+        path : str
+            path to the manifest file
+        force : bool
+            consider every chart out of date, rebuilding them all
+        """
+        self.path = path
+        self.force = force
+        self.rendered = 0
+        self.skipped = 0
+        self.paths = [] # charts drawn or found up to date by this run, in order
+        try:
+            with open(path, 'rb') as file:
+                self.charts = pickle.load(file)
+        except Exception:
+            self.charts = {}
+
+    def fingerprint(self, figure, args, inputs, extra=()):
+        """
+        Identifies what a chart is drawn from.
+
+        Parameters
+        ----------
+        figure : str
+            name of the figure
+        args : tuple
+            parameters of the figure, datasets among them are ignored as the
+            data actually plotted is in inputs
+        inputs : dict
+            the arrays plotted by the figure, possibly nested in lists and tuples
+        extra : tuple
+            any other value affecting the result, e.g. colors and legends
+
+        Returns
+        -------
+        str
+            The hexadecimal BLAKE2 digest of all of the above and of the style settings
+        """
+        digest = hashlib.blake2b(figure.encode())
+        def update(value):
+            if isinstance(value, np.ndarray):
+                digest.update(repr((value.shape, value.dtype.str)).encode())
+                digest.update(np.ascontiguousarray(value).tobytes())
+            elif isinstance(value, (list, tuple)):
+                digest.update(b'[')
+                for v in value:
+                    update(v)
+                digest.update(b']')
+            elif isinstance(value, dict):
+                for k in sorted(value):
+                    digest.update(repr(k).encode())
+                    update(value[k])
+            elif isinstance(value, xr.Dataset):
+                digest.update(b'<dataset>')
+            else:
+                digest.update(repr(value).encode())
+        update(args)
+        update(inputs)
+        update(extra)
+        # Fonts, sizes and the like set by the script, the backend does not change the files
+        digest.update(repr(sorted((k, v) for k, v in matplotlib.rcParams.items() if k != 'backend')).encode())
+        return digest.hexdigest()
+
+    def upToDate(self, path, fingerprint):
+        """
+        Tells whether a chart file exists and was drawn from the same inputs,
+        counting the skipped charts.
+
+        Parameters
+        ----------
+        path : str
+            path to the chart file
+        fingerprint : str
+            the fingerprint of its current inputs
+
+        Returns
+        -------
+        bool
+            True if the chart does not need to be drawn again
+        """
+        upToDate = not self.force and self.charts.get(path) == fingerprint and os.path.exists(path)
+        if upToDate:
+            self.skipped += 1
+            self.paths.append(path)
+        return upToDate
+
+    def record(self, path, fingerprint):
+        """
+        Records that a chart was drawn.
+
+        Parameters
+        ----------
+        path : str
+            path to the chart file
+        fingerprint : str
+            the fingerprint of the inputs it was drawn from
+        """
+        self.charts[path] = fingerprint
+        self.rendered += 1
+        self.paths.append(path)
+
+    def save(self):
+        """
+        Writes the manifest.
+        """
+        with open(self.path, 'wb') as file:
+            pickle.dump(self.charts, file, protocol=-1)
+
+def writeContactSheet(directory, charts, name='index.html', title='Charts'):
+    """
+    Writes a page showing the charts of a run side by side: PNG previews as
+    images, charts drawn only as PDF as a link to the file.
+
+    Parameters
+    ----------
+    directory : str
+        directory of the page
+    charts : list of str
+        paths to the charts, e.g. the paths of a ChartManifest
+    name : str
+        file name of the page, written in the directory
+    title : str
+        title of the page
+
+    Returns
+    -------
+    str
+        The path to the page
+    """
+    cells = []
+    for chart in sorted(set(charts), key=os.path.basename):
+        target = html.escape(os.path.relpath(chart, directory), quote=True)
+        label = html.escape(os.path.splitext(os.path.basename(chart))[0])
+        if chart.endswith('.png'):
+            preview = '<img src="' + target + '" alt="' + label + '">'
+        else:
+            preview = '<span class="pdf">PDF</span>'
+        cells.append('<figure><a href="' + target + '">' + preview + '</a><figcaption>' + label + '</figcaption></figure>')
+    path = os.path.join(directory, name)
+    with open(path, 'w') as file:
+        file.write('<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>' + html.escape(title) + '</title>\n'
+                   '<style>body{font-family:sans-serif;display:flex;flex-wrap:wrap}figure{width:320px;margin:8px}'
+                   'img{width:100%;border:1px solid #ccc}figcaption{font-size:12px;word-break:break-all}'
+                   '.pdf{display:block;padding:80px 0;text-align:center;border:1px solid #ccc;color:#555}</style></head>\n<body>\n'
+                   + '\n'.join(cells) + '\n</body></html>\n')
+    return path
@@ -0,0 +1,122 @@
+import os
+import numpy as np
+import xarray as xr
+
+# NetCDF4/HDF5 backends support chunked variables, in order of preference
+chunkedEngines = ['netcdf4', 'h5netcdf']
+
+def storeEngine():
+    """
+    Picks the xarray backend used for the on-disk datasets.
+
+    Returns
+    -------
+    str
+        The first available chunk-capable NetCDF engine, or 'scipy' (NetCDF3,
+        no chunking) if none is installed
+
+    """
+    available = xr.backends.list_engines()
+    return next((engine for engine in chunkedEngines if engine in available), 'scipy')
+
+def datasetPath(prefix, experiment):
+    """
+    Gets the path of the on-disk store of an experiment.
+
+    Parameters
+    ----------
+    prefix : str
+        common prefix of the output files
+    experiment : str
+        name of the experiment
+
+    Returns
+    -------
+    str
+        The path of the NetCDF file
+
+    """
+    return prefix + '_' + experiment + '.nc'
+
+def quantizedEncoding(low, high, dtype='int16', floatDtype='float64'):
+    """
+    Computes the NetCDF (CF) packing of a bounded variable into integers.
+    The lowest integer is reserved as the fill value representing NaN, the
+    others span [low, high] uniformly.
+
+    Parameters
+    ----------
+    low : float
+        lower bound of the variable
+    high : float
+        upper bound of the variable
+    dtype : str
+        integer type stored on disk
+    floatDtype : str
+        floating point type the values are decoded to
+
+    Returns
+    -------
+    dict
+        The encoding of the variable, with dtype, scale_factor, add_offset and _FillValue
+
+    """
+    info = np.iinfo(dtype)
+    scale = (high - low) / (int(info.max) - int(info.min) - 1)
+    offset = low - (int(info.min) + 1) * scale
+    return {'dtype': dtype, 'scale_factor': np.dtype(floatDtype).type(scale), 'add_offset': np.dtype(floatDtype).type(offset), '_FillValue': info.min}
+
+def saveDataset(path, dataset, chunks=None, dtype=None, quantized=None):
+    """
+    Writes a dataset to a chunked NetCDF file. The file is written aside and
+    then moved in place, so a failure never leaves a truncated store behind.
+
+    Parameters
+    ----------
+    path : str
+        path to the NetCDF file
+    dataset : xarray.Dataset
+        the dataset to store
+    chunks : dict, optional
+        chunk size per dimension, dimensions not listed are stored whole
+    dtype : str, optional
+        floating point type of the stored data variables, None keeps their type
+    quantized : dict, optional
+        variable name to its (low, high) bounds: these variables are stored as
+        16-bit integers (see quantizedEncoding), values out of bounds are clipped
+
+    """
+    engine = storeEngine()
+    encoding = {name: {} for name in dataset.data_vars}
+    if engine in chunkedEngines:
+        chunks = chunks or {}
+        for name, variable in dataset.data_vars.items():
+            encoding[name]['chunksizes'] = tuple(min(chunks.get(dim, size), size) for dim, size in variable.sizes.items())
+    for name, variable in dataset.data_vars.items():
+        if dtype is not None:
+            encoding[name]['dtype'] = dtype
+        if quantized and name in quantized:
+            low, high = quantized[name]
+            dataset = dataset.assign({name: variable.clip(low, high)})
+            encoding[name].update(quantizedEncoding(low, high, floatDtype=dtype or variable.dtype))
+    tmp = path + '.tmp'
+    dataset.to_netcdf(tmp, engine=engine, encoding=encoding)
+    os.replace(tmp, path)
+
+def openDataset(path):
+    """
+    Opens a dataset written by saveDataset without loading it: values are read
+    from disk only when accessed, and selections read only the chunks they touch.
+
+    Parameters
+    ----------
+    path : str
+        path to the NetCDF file
+
+    Returns
+    -------
+    xarray.Dataset
+        The lazily-loaded dataset
+
+    """
+    return xr.open_dataset(path, engine=storeEngine())
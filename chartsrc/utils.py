@@ -1,5 +1,11 @@
+import bz2
+import gzip
+import lzma
 import numpy as np
+import os
 import re
+from collections import namedtuple
+from itertools import chain
 
 class Labels:
     def __init__(self, colors, errColors, variables, legends):
@@ -13,28 +19,89 @@ class Labels:
 
 
 
-def distance(val, ref):
-    return abs(ref - val)
-vectDistance = np.vectorize(distance)
+def nearestIndices(times, samples):
+    """
+    Finds, for each sample, the index of the closest value in a sorted array.
+    Ties are resolved in favour of the earlier value.
 
-def getClosest(sortedMatrix, column, val):
-    while len(sortedMatrix) > 3:
-        half = int(len(sortedMatrix) / 2)
-        sortedMatrix = sortedMatrix[-half - 1:] if sortedMatrix[half, column] < val else sortedMatrix[: half + 1]
-    if len(sortedMatrix) == 1:
-        result = sortedMatrix[0].copy()
-        result[column] = val
-        return result
-    else:
-        safecopy = sortedMatrix.copy()
-        safecopy[:, column] = vectDistance(safecopy[:, column], val)
-        minidx = np.argmin(safecopy[:, column])
-        safecopy = safecopy[minidx, :].A1
-        safecopy[column] = val
-        return safecopy
+    Parameters
+    ----------
+    times : numpy.ndarray
+        sorted one-dimensional array
+    samples : numpy.ndarray
+        values to look up
+
+    Returns
+    -------
+    numpy.ndarray
+        The index of the nearest element of times for each sample
+
+    """
+    samples = np.asarray(samples)
+    if len(times) < 2:
+        return np.zeros(samples.shape, dtype=np.intp)
+    right = np.clip(np.searchsorted(times, samples), 1, len(times) - 1)
+    left = right - 1
+    return np.where(samples - times[left] <= times[right] - samples, left, right)
 
-def convert(column, samples, matrix):
-    return np.matrix([getClosest(matrix, column, t) for t in samples])
+def resample(column, samples, matrix):
+    """
+    Resamples a matrix sorted by one of its columns, picking for each sample
+    the closest row and replacing its value in the sorting column with the sample.
+
+    Parameters
+    ----------
+    column : int
+        index of the sorting (time) column
+    samples : numpy.ndarray
+        the new values of the sorting column
+    matrix : numpy.ndarray
+        two-dimensional array sorted by column
+
+    Returns
+    -------
+    numpy.ndarray
+        A matrix with one row per sample
+
+    """
+    matrix = np.asarray(matrix)
+    result = matrix[nearestIndices(matrix[:, column], samples)]
+    result[:, column] = samples
+    return result
+
+def resampleStack(column, samples, stack):
+    """
+    Resamples a stack of matrices with the same number of rows in a single batch,
+    with the same semantics of resample.
+
+    Parameters
+    ----------
+    column : int
+        index of the sorting (time) column
+    samples : numpy.ndarray
+        the new values of the sorting column
+    stack : numpy.ndarray
+        three-dimensional array (matrix, row, column), each matrix sorted by column
+
+    Returns
+    -------
+    numpy.ndarray
+        A stack with one row per sample in each matrix
+
+    """
+    stack = np.asarray(stack)
+    times = stack[:, :, column]
+    if times.shape[1] < 2:
+        indices = np.zeros((len(stack), len(samples)), dtype=np.intp)
+    else:
+        right = np.stack([np.searchsorted(t, samples) for t in times]) if len(stack) else np.empty((0, len(samples)), dtype=np.intp)
+        right = np.clip(right, 1, times.shape[1] - 1)
+        left = right - 1
+        closerLeft = samples - np.take_along_axis(times, left, axis=1) <= np.take_along_axis(times, right, axis=1) - samples
+        indices = np.where(closerLeft, left, right)
+    result = np.take_along_axis(stack, indices[:, :, np.newaxis], axis=1)
+    result[:, :, column] = samples
+    return result
 
 def valueOrEmptySet(k, d):
     return (d[k] if isinstance(d[k], set) else {d[k]}) if k in d else set()
@@ -70,6 +137,101 @@ def is_float(string):
     except ValueError:
         return False
 
+coordinatesRegex = re.compile(' (?P<varName>[a-zA-Z]+) = (?P<varValue>(?:[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?)|[a-zA-Z-_]*)?')
+variableNamesRegex = re.compile(' (?P<varName>\S+)')
+dataBeginRegex = re.compile('\d')
+
+AlchemistExport = namedtuple('AlchemistExport', ['coordinates', 'variables', 'data'])
+
+# Exports compressed with these suffixes (e.g. name.csv.gz) are decompressed while reading
+compressedOpeners = {'.gz': gzip.open, '.xz': lzma.open, '.bz2': bz2.open}
+
+def openExport(path):
+    """
+    Opens an Alchemist export as a text stream. Compressed exports are
+    decompressed incrementally while the stream is read, never inflated as a whole.
+
+    Parameters
+    ----------
+    path : str
+        path to the target file, plain text or compressed with gzip, xz or bz2
+
+    Returns
+    -------
+    file object
+        A text stream over the content of the export
+
+    """
+    opener = compressedOpeners.get(os.path.splitext(path)[1], open)
+    return opener(path, 'rt')
+
+def scanHeader(file):
+    """
+    Consumes the header of an open Alchemist file, stopping at the first data line.
+
+    Parameters
+    ----------
+    file : file object
+        text stream positioned at the beginning of the file
+
+    Returns
+    -------
+    tuple
+        The coordinates dictionary, the list of column names and the first
+        data line (None if the file contains no data)
+
+    """
+    coordinates = None
+    lastHeaderLine = ''
+    for line in file:
+        if dataBeginRegex.match(line[0]):
+            break
+        if coordinates is None:
+            match = coordinatesRegex.findall(line)
+            if match:
+                coordinates = {var : (float(value) if is_float(value) else value) for var, value in match}
+        lastHeaderLine = line
+    else:
+        line = None
+    variables = variableNamesRegex.findall(lastHeaderLine) if lastHeaderLine else []
+    return coordinates or {}, variables, line
+
+def parseAlchemistExport(path, columns=None):
+    """
+    Reads the header coordinates, the column names and the numeric block of
+    an Alchemist export file in a single pass.
+
+    Parameters
+    ----------
+    path : str
+        path to the target file
+    columns : list of str, optional
+        names of the columns to load, None loads all of them. The values of
+        the other columns are neither converted nor stored.
+
+    Returns
+    -------
+    AlchemistExport
+        A named tuple with the coordinates dictionary, the list of loaded
+        column names (in file order) and a float64 matrix with one row per
+        exported sample
+
+    """
+    with openExport(path) as file:
+        coordinates, variables, firstLine = scanHeader(file)
+        usecols = None
+        if columns is not None:
+            missing = set(columns) - set(variables)
+            if missing:
+                raise ValueError(path + " has no column " + ", ".join(sorted(missing)))
+            usecols = [i for i, v in enumerate(variables) if v in columns]
+            variables = [variables[i] for i in usecols]
+        if firstLine is None:
+            data = np.empty((0, len(variables)))
+        else:
+            data = np.loadtxt(chain([firstLine], file), comments='#', ndmin=2, dtype=np.float64, usecols=usecols)
+    return AlchemistExport(coordinates, variables, data)
+
 def extractCoordinates(filename):
     """
     Scans the header of an Alchemist file in search of the variables.
@@ -78,8 +240,6 @@ def extractCoordinates(filename):
     ----------
     filename : str
         path to the target file
-    mergewith : dict
-        a dictionary whose dimensions will be merged with the returned one
 
     Returns
     -------
@@ -88,15 +248,8 @@ def extractCoordinates(filename):
         lists (set of variable values)
 
     """
-    with open(filename, 'r') as file:
-        regex = re.compile(' (?P<varName>[a-zA-Z]+) = (?P<varValue>(?:[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?)|[a-zA-Z-_]*)?')
-        dataBegin = re.compile('\d')
-        for line in file:
-            match = regex.findall(line)
-            if match:
-                return {var : (float(value) if is_float(value) else value) for var, value in match}
-            elif dataBegin.match(line[0]):
-                return {}
+    with openExport(filename) as file:
+        return scanHeader(file)[0]
 
 def extractVariableNames(filename):
     """
@@ -109,22 +262,12 @@ def extractVariableNames(filename):
 
     Returns
     -------
-    list of list
-        A matrix with the values of the csv file
+    list of str
+        The names of the exported columns
 
     """
-    with open(filename, 'r') as file:
-        dataBegin = re.compile('\d')
-        lastHeaderLine = ''
-        for line in file:
-            if dataBegin.match(line[0]):
-                break
-            else:
-                lastHeaderLine = line
-        if lastHeaderLine:
-            regex = re.compile(' (?P<varName>\S+)')
-            return regex.findall(lastHeaderLine)
-        return []
+    with openExport(filename) as file:
+        return scanHeader(file)[1]
 
 def openCsv(path):
     """
@@ -141,7 +284,4 @@ def openCsv(path):
         A matrix with the values of the csv file
 
     """
-    regex = re.compile('\d')
-    with open(path, 'r') as file:
-        lines = filter(lambda x: regex.match(x[0]), file.readlines())
-        return [[float(x) for x in line.split()] for line in lines]
\ No newline at end of file
+    return parseAlchemistExport(path).data.tolist()
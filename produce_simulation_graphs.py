@@ -1,18 +1,19 @@
 # %%
 import numpy as np
-import xarray as xr
-
-from math import ceil, sqrt
 
 # Prepare the charting system
 import matplotlib
-import matplotlib.pyplot as plt
-import matplotlib.cm as cmx
-from mpl_toolkits.mplot3d import Axes3D # needed for 3d projection
-from mpl_toolkits.mplot3d.art3d import Poly3DCollection
+import os
 
 import chartsrc.kcov_comparison as kcovlib
 from chartsrc.utils import *
+from chartsrc.store import saveDataset, openDataset, datasetPath
+from chartsrc.aggregation import SeedAggregator
+from chartsrc.instrumentation import StageRecorder
+from chartsrc.reductions import AggregateCache
+from chartsrc.rendering import ChartPool, ChartManifest, writeContactSheet
+from chartsrc.catalog import loadCatalog, saveCatalog, updateCatalog, selectExports
+from chartsrc.ingest import aggregateExports, ingestExports, resampleExports, buildDataset, updateDataset, scanExports, diffManifest, loadManifest, saveManifest, loadAvailableColumns, manifestFingerprint
 
 # %%
 if __name__ == '__main__':
@@ -25,6 +26,9 @@ if __name__ == '__main__':
     directory = 'app/build/' + dir + '/'
     charts_dir = 'app/build/charts-adaptive/'
     pickleOutput = 'data_summary'
+    storeChunks = {'Algorithm': 1} # on-disk chunk size per dimension, unlisted dimensions are stored whole
+    storageDtype = 'float64' # type of the dataset in memory and on disk, 'float32' halves the footprint; aggregates are computed in float64
+    quantizedMetrics = None # bounded metrics stored on disk as 16-bit integers, e.g. {'1-coverage': (0, 1), '2-coverage': (0, 1)}
     experiments = [main_experiment]
     floatPrecision = '{: 0.2f}'
     seedVars = ['Seed']
@@ -33,95 +37,178 @@ if __name__ == '__main__':
     maxTime = 1800
     timeColumnName = 'time'
     logarithmicTime = False
+    ingestWorkers = os.cpu_count() # worker processes used to parse and resample the exports, 1 to disable
+    chartWorkers = os.cpu_count() # worker processes rendering the charts, 1 to render them in this process
+    forceCharts = False # redraw every chart, even those whose data and parameters did not change since the last run
+    previewCharts = False # draw low resolution PNG previews and an index page of them instead of the PDFs
+    previewDpi = 50 # resolution of the previews
+    pdfCharts = [] # charts drawn as PDF even in preview mode, by file name without extension (e.g. 'KCov_3D')
+    streamingAggregation = False # fold each file into running statistics over seedVars instead of keeping every run
+    streamingBatch = 256 # files held in memory at once while streaming
+    aggregatedRatios = {'MovEfficiency': ('ObjDist', 'CamDist')} # ratios of the time sums of each run, computed while streaming
+    # algos = ["ff_linpro_c", "ff_linpro", "sm_av_c", "sm_av", "bc_re_c", "bc_re", "ff_nocomm_c", "ff_nocomm"]
+    algos = ["ff_linpro_c", "ff_linpro_ac"]
+#     algos = ["ff_linpro_c", "ff_linproF_c", "sm_av_c", "bc_re_c"]
+    ingestSelection = {'Algorithm': algos} # only exports whose file name matches are opened, None to ingest everything
+    requiredColumns = ['1-coverage', '2-coverage', 'ObjDist', 'CamDist'] # metrics loaded from the exports besides time, None to load all
+    traceMemory = ['parse', 'parse+resample', 'resample', 'parse+aggregate', 'populate'] # stages whose peak memory is traced, True for all (slows the chart stages several times); the change of resident memory of every stage is always recorded
+    stageReport = pickleOutput + '_stages.json' # JSON report of the stages, None to only print the summary
+    aggregateCache = pickleOutput + '_aggregates' # directory of the memoized reductions of the dataset, None to disable
 
     
     # Setup libraries
     np.set_printoptions(formatter={'float': floatPrecision.format})
-    # Read the last time the data was processed, reprocess only if new data exists, otherwise just load
-    import pickle
-    import os
-    newestFileTime = max(os.path.getmtime(directory + '/' + file) for file in os.listdir(directory))
-    try:
-        lastTimeProcessed = pickle.load(open('timeprocessed', 'rb'))
-    except:
-        lastTimeProcessed = -1
-    shouldRecompute = newestFileTime != lastTimeProcessed
+    if previewCharts:
+        matplotlib.use('Agg')
+    # Compare the exports with the manifest of the last run: only new or changed files are parsed
+    timefun = np.logspace if logarithmicTime else np.linspace
+    computeMin = minTime is None
+    computeMax = maxTime is None
+    settings = {'timeSamples': timeSamples, 'minTime': minTime, 'maxTime': maxTime,
+                'logarithmicTime': logarithmicTime, 'timeColumnName': timeColumnName,
+                'streamingAggregation': streamingAggregation, 'seedVars': seedVars, 'aggregatedRatios': aggregatedRatios,
+                'ingestSelection': ingestSelection, 'requiredColumns': requiredColumns,
+                'storageDtype': storageDtype, 'quantizedMetrics': quantizedMetrics}
+    stages = StageRecorder(traceMemory)
+    stages.start('cache load')
+    manifests = loadManifest(pickleOutput + '_manifest', settings)
+    availableColumns = loadAvailableColumns(pickleOutput + '_manifest')
     datasets = dict()
-    if not shouldRecompute:
+    if manifests:
         try:
-            #means = pickle.load(open(pickleOutput + '_mean', 'rb'))
-            #stdevs = pickle.load(open(pickleOutput + '_std', 'rb'))
-            datasets = pickle.load(open(pickleOutput + '_datasets', 'rb'))
+            datasets = { experiment: openDataset(datasetPath(pickleOutput, experiment)) for experiment in manifests }
         except:
-            shouldRecompute = True
-            
-    if shouldRecompute:
-        timefun = np.logspace if logarithmicTime else np.linspace
-        means = {}
-        stdevs = {}
-        for experiment in experiments:
-            # Collect all files for the experiment of interest
-            import fnmatch
-            allfiles = filter(lambda file: fnmatch.fnmatch(file, experiment + '*.csv'), os.listdir(directory))
-            allfiles = [directory + '/' + name for name in allfiles]
-            allfiles.sort()
-            # From the file name, extract the independent variables
+            manifests = {}
+    stages.stop(items=len(datasets))
+    shouldSave = False
+    catalog = loadCatalog(pickleOutput + '_catalog')
+    for experiment in experiments:
+        stages.start('discovery')
+        # Collect the files of the experiment of interest matching the selection, using only their names
+        catalog[experiment] = updateCatalog(catalog.get(experiment, {}), directory, experiment)
+        selected = selectExports(catalog[experiment], ingestSelection)
+        allfiles = [directory + '/' + name for name in selected]
+        print("Number of files:", len(allfiles), "of", len(catalog[experiment]))
+        previous = manifests.get(experiment, {}) if experiment in datasets else {}
+        manifest = scanExports(allfiles, previous)
+        changed, removed = diffManifest(previous, manifest)
+        stages.stop(items=len(allfiles))
+        if not changed and not removed:
+            continue
+        shouldSave = True
+        if not allfiles:
+            # Every export of the experiment was removed: so is its dataset
+            print("No files left, removing the dataset of", experiment)
+            if experiment in datasets:
+                datasets.pop(experiment).close()
+            if os.path.exists(datasetPath(pickleOutput, experiment)):
+                os.remove(datasetPath(pickleOutput, experiment))
+            manifests.pop(experiment, None)
+            availableColumns.pop(experiment, None)
+            continue
+        # Record every exported column, including those that are not loaded
+        availableColumns[experiment] = extractVariableNames(allfiles[0])
+        if requiredColumns is not None:
+            print("Skipped columns:", [c for c in availableColumns[experiment] if c != timeColumnName and c not in requiredColumns])
+        # With a timeline computed from the data, any change requires processing all files again
+        incremental = bool(previous) and not (computeMin or computeMax)
+        if experiment in datasets:
+            # The store is going to be rewritten: release the file, keeping the data only if it is merged
+            if incremental:
+                with stages.stage('cache load', 1):
+                    datasets[experiment].load()
+            datasets[experiment].close()
+        # Parse every file once: header coordinates, column names and values.
+        # If the timeline is fixed in advance, the workers also resample the data.
+        timeline = None if computeMin or computeMax else timefun(minTime, maxTime, timeSamples)
+        dataset = None
+        if streamingAggregation:
+            if timeline is None:
+                raise ValueError("Streaming aggregation requires minTime and maxTime")
+            # Running statistics can absorb new runs, but not forget changed or removed ones
+            additionsOnly = incremental and not removed and all(file not in previous for file in changed)
+            toParse = changed if additionsOnly else allfiles
+            print("Files to parse:", len(toParse))
+            # The catalog provides the coordinates, headers are read only for names it could not parse
+            def fileCoordinates(file):
+                coordinates = catalog[experiment][os.path.basename(file)]
+                return coordinates if coordinates is not None else extractCoordinates(file)
             dimensions = {}
-            print("Number of files:", len(allfiles))
-            for file in allfiles:
-                dimensions = mergeDicts(dimensions, extractCoordinates(file))
-            dimensions = {k: sorted(v) for k, v in dimensions.items()}
-            # Add time to the independent variables
-            dimensions[timeColumnName] = range(0, timeSamples)
-            # Compute the matrix shape
-            shape = tuple(len(v) for k, v in dimensions.items())
-            # Prepare the Dataset
-            dataset = xr.Dataset()
-            for k, v in dimensions.items():
-                dataset.coords[k] = v
-            varNames = extractVariableNames(allfiles[0])
-            for v in varNames:
-                if v != timeColumnName:
-                    novals = np.ndarray(shape)
-                    novals.fill(float('nan'))
-                    dataset[v] = (dimensions.keys(), novals)
-            # Compute maximum and minimum time, create the resample
-            timeColumn = varNames.index(timeColumnName)
-            allData = { file: np.matrix(openCsv(file)) for file in allfiles }
-            computeMin = minTime is None
-            computeMax = maxTime is None
-            if computeMax:
-                maxTime = float('-inf')
-                for data in allData.values():
-                    maxTime = max(maxTime, data[-1, timeColumn])
-            if computeMin:
-                minTime = float('inf')
-                for data in allData.values():
-                    minTime = min(minTime, data[0, timeColumn])
-            #print(allData)
-            timeline = timefun(minTime, maxTime, timeSamples)
-            # Resample
-            for file in allData:
-                allData[file] = convert(timeColumn, timeline, allData[file])
-                
-            # Populate the dataset
-            for file, data in allData.items():
-                dataset[timeColumnName] = timeline
-                for idx, v in enumerate(varNames):
-                    if v != timeColumnName:
-                        darray = dataset[v]
-                        experimentVars = extractCoordinates(file)
-                        darray.loc[experimentVars] = data[:, idx].A1
-            #print(dataset)
-            # Fold the dataset along the seed variables, producing the mean and stdev datasets
-            #means[experiment] = dataset.mean(seedVars)
-            #stdevs[experiment] = dataset.std(seedVars)
-            datasets[experiment] = dataset
-        # Save the datasets
+            for file in toParse:
+                dimensions = mergeDicts(dimensions, fileCoordinates(file))
+            metrics = [v for v in (requiredColumns or availableColumns[experiment]) if v != timeColumnName]
+            aggregator = None
+            if additionsOnly:
+                aggregator = SeedAggregator.fromDataset(datasets[experiment])
+                if set(dimensions) == set(aggregator.dims + aggregator.seedVars) and metrics == aggregator.metrics:
+                    aggregator.grow(dimensions)
+                else:
+                    print("The new files do not match the cached aggregates, processing all files")
+                    toParse = allfiles
+                    for file in toParse:
+                        dimensions = mergeDicts(dimensions, fileCoordinates(file))
+                    aggregator = None
+            if aggregator is None:
+                aggregator = SeedAggregator({k: sorted(v) for k, v in dimensions.items()}, seedVars, metrics, timeline, ratios=aggregatedRatios)
+            with stages.stage('parse+aggregate', len(toParse)):
+                coordinates = aggregateExports(aggregator, toParse, timeColumnName, timeline, workers=ingestWorkers, batchSize=streamingBatch, columns=requiredColumns)
+            for file, coords in coordinates.items():
+                manifest[file] = manifest[file]._replace(coordinates=coords)
+            dataset = aggregator.toDataset()
+        else:
+            toParse = changed if incremental else allfiles
+            print("Files to parse:", len(toParse))
+            # With a fixed timeline the workers resample while parsing, both are timed as one stage
+            parseStage = 'parse' if timeline is None else 'parse+resample'
+            with stages.stage(parseStage, len(toParse)):
+                exports = ingestExports(toParse, timeColumnName, timeline, workers=ingestWorkers, columns=requiredColumns)
+            if timeline is None:
+                # Compute maximum and minimum time, create the resample
+                timeColumn = exports[allfiles[0]].variables.index(timeColumnName)
+                expMinTime = min(export.data[0, timeColumn] for export in exports.values()) if computeMin else minTime
+                expMaxTime = max(export.data[-1, timeColumn] for export in exports.values()) if computeMax else maxTime
+                timeline = timefun(expMinTime, expMaxTime, timeSamples)
+                # Resample
+                with stages.stage('resample', len(exports)):
+                    exports = resampleExports(exports, timeColumnName, timeline)
+            for file, export in exports.items():
+                manifest[file] = manifest[file]._replace(coordinates=export.coordinates)
+            if incremental:
+                stale = [previous[file].coordinates for file in removed + changed if file in previous]
+                with stages.stage('populate', len(exports)):
+                    dataset = updateDataset(datasets[experiment], exports, stale, timeColumnName, timeline)
+                if dataset is None:
+                    print("The new files do not match the cached dataset, processing all files")
+                    missing = [file for file in allfiles if file not in exports]
+                    with stages.stage(parseStage, len(missing)):
+                        exports.update(ingestExports(missing, timeColumnName, timeline, workers=ingestWorkers, columns=requiredColumns))
+                    for file, export in exports.items():
+                        manifest[file] = manifest[file]._replace(coordinates=export.coordinates)
+            if dataset is None:
+                # Prepare and populate the Dataset
+                with stages.stage('populate', len(exports)):
+                    dataset = buildDataset(exports, timeColumnName, timeline, dtype=storageDtype)
+        #print(dataset)
+        # Fold the dataset along the seed variables, producing the mean and stdev datasets
+        #means[experiment] = dataset.mean(seedVars)
+        #stdevs[experiment] = dataset.std(seedVars)
+        datasets[experiment] = dataset
+        manifests[experiment] = manifest
+        # Save the dataset
         #pickle.dump(means, open(pickleOutput + '_mean', 'wb'), protocol=-1)
         #pickle.dump(stdevs, open(pickleOutput + '_std', 'wb'), protocol=-1)
-        pickle.dump(datasets, open(pickleOutput + '_datasets', 'wb'), protocol=-1)
-        pickle.dump(newestFileTime, open('timeprocessed', 'wb'))
+        with stages.stage('cache save', 1):
+            # The running statistics of the streaming mode are always stored in full precision
+            if streamingAggregation:
+                saveDataset(datasetPath(pickleOutput, experiment), dataset, chunks=storeChunks)
+            else:
+                saveDataset(datasetPath(pickleOutput, experiment), dataset, chunks=storeChunks, dtype=storageDtype, quantized=quantizedMetrics)
+    with stages.stage('cache save'):
+        if shouldSave:
+            saveManifest(pickleOutput + '_manifest', settings, manifests, availableColumns)
+        saveCatalog(pickleOutput + '_catalog', catalog)
+    if main_experiment not in datasets:
+        raise ValueError("No exports of " + main_experiment + " in " + directory)
 
 
     figure_size=(6, 6)
@@ -135,12 +222,36 @@ if __name__ == '__main__':
 
     kcovLabels = Labels(kcovColors, kcovEcolors, kcovVariables, kcovTrans)
 
-    data = datasets[main_experiment]
-    # algos = ["ff_linpro_c", "ff_linpro", "sm_av_c", "sm_av", "bc_re_c", "bc_re", "ff_nocomm_c", "ff_nocomm"]
-    algos = ["ff_linpro_c", "ff_linpro_ac"]
-#     algos = ["ff_linpro_c", "ff_linproF_c", "sm_av_c", "bc_re_c"]
-
-#     algos = data.coords['Algorithm'].data.tolist()
+#     algos = datasets[main_experiment].coords['Algorithm'].data.tolist()
+
+    stages.start('aggregation')
+    if streamingAggregation:
+        aggregates = SeedAggregator.fromDataset(datasets[main_experiment]).results()
+        aggregates = { name: view.sel(Algorithm=algos) for name, view in aggregates.items() }
+    else:
+        # Select the plotted algorithms first: the store is read lazily, so only their chunks are loaded
+        data = [('sel', {'Algorithm': algos})]
+        # Time means and sums of every run and the means over seeds in time come from a single pass,
+        # the means and deviations over seeds of the time statistics from another one
+        runStats = data + [('statistics', {'time': ['time'], 'seed': ['Seed']}, ['mean', 'sum'])]
+        timeStats = runStats + [('grouping', 'time')]
+        dataMean = timeStats + [('sel', {'statistic': 'mean'})]
+        dataDist = timeStats + [('sel', {'statistic': 'sum'}), ('ratio', 'MovEfficiency', 'ObjDist', 'CamDist')]
+        seedStats = [('statistics', ['Seed'], ['mean', 'std'])]
+        specs = {
+            'seedMean': runStats + [('grouping', 'seed'), ('sel', {'statistic': 'mean'})],
+            'timeMeanSeedMean': dataMean + seedStats + [('sel', {'statistic': 'mean'})],
+            'timeMeanSeedStd': dataMean + seedStats + [('sel', {'statistic': 'std'})],
+            'timeSumSeedMean': dataDist + seedStats + [('sel', {'statistic': 'mean'})],
+            'timeSumSeedStd': dataDist + seedStats + [('sel', {'statistic': 'std'})],
+        }
+        # Common prefixes are computed once; reductions computed by a previous run on the same data are loaded instead of recomputed
+        fingerprint = manifestFingerprint(manifests[main_experiment], settings) if aggregateCache is not None else None
+        cache = AggregateCache(aggregateCache, datasets[main_experiment], fingerprint)
+        aggregates = { name: cache.get(spec) for name, spec in specs.items() }
+        if aggregateCache is not None:
+            cache.prune()
+            print("Cached aggregates:", cache.hits, "loaded,", cache.misses, "computed")
 
     # now load data from previous simulations
     #print("loading old data...")
@@ -151,26 +262,27 @@ if __name__ == '__main__':
     #mergedDatasets = {'simulations': data}
     #pickle.dump(mergedDatasets, open(pickleOutput + '_datasets_merged', 'wb'), protocol=-1)
     
-    dataMean = data.mean('time')
-    dataKcovsMean = dataMean.mean('Seed').mean('ClusteringDistance') 
-    dataKcovsStd = dataMean.std('Seed').mean('ClusteringDistance')
+    dataKcovsMean = aggregates['timeMeanSeedMean'].mean('ClusteringDistance') 
+    dataKcovsStd = aggregates['timeMeanSeedStd'].mean('ClusteringDistance')
     
-    dataDist = data.sum('time').assign(MovEfficiency = lambda d: d.ObjDist / d.CamDist)
-    dataDistMean = dataDist.mean('Seed')
-    dataDistStd = dataDist.std('Seed')
+    dataDistMean = aggregates['timeSumSeedMean']
+    dataDistStd = aggregates['timeSumSeedStd']
+    stages.stop(items=len(aggregates))
     
-    simRatios = data.coords['CamHerdRatio'].data.tolist()
+    simRatios = dataKcovsMean.coords['CamHerdRatio'].data.tolist()
     simRatios.reverse()
-    herdNumbers = data.coords['NumberOfHerds'].data.tolist()
+    herdNumbers = dataKcovsMean.coords['NumberOfHerds'].data.tolist()
     herdNumbers.reverse()
 
 
-    kcovChartBuilder = kcovlib.KcovChartBuilder(charts_dir, dataKcovsMean, dataKcovsStd, algos, kcovLabels)
+    # Figures are dispatched to the workers as they are requested, each chart family waits for its own
+    # Charts whose file exists and whose inputs did not change since the last run are skipped
+    chartPool = ChartPool(chartWorkers, release=kcovlib.releaseLayouts)
+    chartManifest = ChartManifest(pickleOutput + '_charts', force=forceCharts)
+    chartOutput = {'previewDpi': previewDpi if previewCharts else None, 'fullCharts': pdfCharts}
+    kcovChartBuilder = kcovlib.KcovChartBuilder(charts_dir, dataKcovsMean, dataKcovsStd, algos, kcovLabels, **chartOutput, pool=chartPool, manifest=chartManifest)
 
     
-    def noOdds(lst): # replaces odds numbers in lst with empty strings
-        return list(map(lambda x: x if round(x * 10, 0) % 2 == 0 else '', lst))
-    
     """""""""""""""""""""""""""
                 kcov 3D
     """""""""""""""""""""""""""
@@ -179,121 +291,51 @@ if __name__ == '__main__':
     #titlesize = 25
     #matplotlib.rcParams.update({'axes.titlesize': titlesize})
     #matplotlib.rcParams.update({'axes.labelsize': labelsize})
-    def getSurfData(dataarray, xcord, ycord):
-        xs = []
-        ys = []
-        zs = []
-        for xd in dataarray:
-            for i, yd in enumerate(xd):
-                vals = xd[xcord].values
-                if(isinstance(vals, np.ndarray) and vals.size > 1):
-                    xs.append(vals.tolist()[i])
-                else:
-                    xs.append(vals.tolist())
-
-                ys.append(yd[ycord].values.tolist())
-                zs.append(yd.values.tolist())
-
-        return xs, ys, zs
-        
-    fig = plt.figure(figsize=(12,16))
-    for idx, algo in enumerate(algos):
-        cols = 2
-        rows = ceil(len(algos) / 2)
-        ax = fig.add_subplot(rows,cols,idx+1, projection='3d')
-
-        #ax.tick_params(labelsize=labelsize)
-        ax.set_xlabel("m")
-        ax.set_ylabel("n/m")
-        if idx%cols == cols-1:
-            ax.set_zlabel("Coverage (%)")
-        #else:
-        #    ax.set_zticklabels([])
-        ax.set_xlim([max(herdNumbers),min(herdNumbers)])
-        ax.set_ylim([min(simRatios),max(simRatios)])
-        ax.set_zlim([0,1])
-        ax.set_title(algo)
-        
-        fakeLinesForLegend = []
-        def kcov(whichKCov,x,y):
-            return dataKcovsMean[whichKCov].sel(Algorithm=algo, CamHerdRatio=y, NumberOfHerds=x).values.tolist()#[0]
-        forKcovVars = [kcovVariables[0], kcovVariables[-1]]
-        forKcovTrans = []
-        for k, whichKCov in enumerate(kcovVariables):
-            if not whichKCov in forKcovVars:
-                continue
-            x,y,z = getSurfData(dataKcovsMean[whichKCov].sel(Algorithm=algo), 'NumberOfHerds', 'CamHerdRatio')
-            # print(x)
-            # print(y)
-            # print(z)
-            ax.plot_trisurf(x,y,z, linewidth=2, antialiased=False, shade=True, alpha=0.5, color=kcovColors[k])
-            fakeLinesForLegend.append(matplotlib.lines.Line2D([0],[0], linestyle='none', c=kcovColors[k], marker='o'))
-            forKcovTrans.append(kcovTrans[k])
-        if idx == cols-1:
-            ax.legend(fakeLinesForLegend, forKcovTrans, numpoints=1)
-        
-    plt.tight_layout()
-    fig.savefig(charts_dir + 'KCov_3D.pdf')
-    plt.close(fig)
+    stages.start('3D charts', 1)
+    kcovChartBuilder.surfaces(herdNumbers, simRatios)
+    chartPool.wait()
+    stages.stop()
     #matplotlib.rcParams.update(oldParams)
     
     """""""""""""""""""""""""""
           kcov in time
     """""""""""""""""""""""""""
+    stages.start('in-time charts')
     timeLimit = timeSamples
     selAlgos = algos
     selRatios = [ '0.5', '1.0', '1.5', '2.0']
     selKcov = ['1-coverage', "2-coverage"]
     selHerdNumber = 6.0
-    dataInTime = data.mean('Seed').mean("ClusteringDistance")
+    dataInTime = aggregates['seedMean'].mean("ClusteringDistance")
 
 
     columns = ['Algorithm', "NumberOfHerds", "CamHerdRatio"]
     kcovChartBuilder.inTime(columns, selKcov, dataInTime, selHerdNumber, selRatios, timeLimit)
+    inTimeCharts = len(selKcov)
 
 
     if(generateAll and dataIncludeClusteringDistance): # Only for clustering distance
         columns = ['Algorithm', "NumberOfHerds", "ClusteringDistance"]
         # selCamHerdRatio = 1.0 
         selHerdNumbers = [2.0, 4.0, 6.0, 8.0]
-        dataInTime =  data.mean('Seed').mean("CamHerdRatio")
+        dataInTime =  aggregates['seedMean'].mean("CamHerdRatio")
         distances = ['10', '30', '50', '70', '400']
 
         for selHerdNumber in selHerdNumbers:
             kcovChartBuilder.inTimeByValue(columns, selKcov, dataInTime, selHerdNumber, distances, timeLimit, name="clust-distances", unit="m")
+        inTimeCharts += len(selHerdNumbers) * len(selKcov)
+    chartPool.wait()
+    stages.stop(items=inTimeCharts)
         
     """""""""""""""""""""""""""
               heatmaps
     """""""""""""""""""""""""""
+    stages.start('heatmaps', len(kcovVariables))
     simRatios.reverse()
     herdNumbers.reverse()
-    import seaborn as sns
-    rows = 4
-    cols = 2
-    gridspec_kw={'width_ratios': [1,1,0.05], 'height_ratios': [1,1,1,1]}
-    for whichKCov in kcovVariables:
-        fig, axes = plt.subplots(rows, cols+1, figsize=(8,10), sharex='col', gridspec_kw=gridspec_kw)
-        plt.xlim([min(simRatios), max(simRatios)])
-        plt.ylim([0,1])
-        for idx,algo in enumerate(algos):
-            r = int(idx / cols)
-            c = int(idx % cols)
-            data = dataKcovsMean.sel(Algorithm=algo)[whichKCov]
-            cbar = idx%cols == cols - 1 # only charts to the right have the bar
-            ax = sns.heatmap(data, vmin=0, vmax=1, ax=axes[r][c], cbar=cbar, cbar_ax=axes[r][cols], cbar_kws={'label': whichKCov + ' (%)'})
-            if idx%cols == 0:
-                ax.set_ylabel('r')
-                ax.set_yticklabels([str(int(x)) for x in herdNumbers])
-            else:
-                ax.set_yticklabels([])
-            if idx >= cols * (rows - 1):
-                ax.set_xlabel('n/m')
-                ax.set_xticklabels(noOdds(simRatios))
-                
-            ax.invert_yaxis()
-            ax.set_title(algo)
-        fig.savefig(charts_dir + whichKCov + '_heatmap.pdf')
-        plt.close(fig)
+    kcovChartBuilder.heatmaps(simRatios, herdNumbers)
+    chartPool.wait()
+    stages.stop()
     simRatios.reverse()
     herdNumbers.reverse()
     
@@ -305,12 +347,15 @@ if __name__ == '__main__':
 
 
     if(generateAll and False):
+        stages.start('lines charts', len(herdNumbers) + len(simRatios))
         cols = ["Algorithm", 'NumberOfHerds']
         kcovChartBuilder.lines(cols, herdNumbers, simRatios, "CamHerdRatio", "n/m", precision=1)
             
         cols = ["Algorithm", 'CamHerdRatio']
         kcovChartBuilder.lines(cols, simRatios, herdNumbers, "herdNumber", "Number of herds")
-        
+        chartPool.wait()
+        stages.stop()
+
     simRatios.reverse()
     herdNumbers.reverse()  
 
@@ -319,10 +364,13 @@ if __name__ == '__main__':
         kcoverage comparison
     """""""""""""""""""""""""""
     if(generateAll):
+        stages.start('compare charts', len(herdNumbers) + len(simRatios))
         columns = ["Algorithm", 'NumberOfHerds', 'CamHerdRatio']
         kcovChartBuilder.compare(columns, herdNumbers, simRatios, precision=1)
         columns = ["Algorithm", 'CamHerdRatio', 'NumberOfHerds']
         kcovChartBuilder.compare(columns, simRatios, herdNumbers)
+        chartPool.wait()
+        stages.stop()
 
     
     """""""""""""""""""""""""""
@@ -330,18 +378,30 @@ if __name__ == '__main__':
     """""""""""""""""""""""""""
 
     if(generateAll and dataIncludeClusteringDistance):
-        dataKcovsMean2 = dataMean.mean('Seed').mean('NumberOfHerds') #todo
-        dataKcovsStd2 = dataMean.std('Seed').mean('NumberOfHerds')
-        kcovChartBuilder2 = kcovlib.KcovChartBuilder(charts_dir, dataKcovsMean2, dataKcovsStd2, algos, kcovLabels)
+        dataKcovsMean2 = aggregates['timeMeanSeedMean'].mean('NumberOfHerds') #todo
+        dataKcovsStd2 = aggregates['timeMeanSeedStd'].mean('NumberOfHerds')
+        kcovChartBuilder2 = kcovlib.KcovChartBuilder(charts_dir, dataKcovsMean2, dataKcovsStd2, algos, kcovLabels, **chartOutput, pool=chartPool, manifest=chartManifest)
 
-        clusteringDistances = datasets[main_experiment].coords['ClusteringDistance'].data.tolist()
+        clusteringDistances = aggregates['seedMean'].coords['ClusteringDistance'].data.tolist()
         clusteringDistances.reverse()
         
         
+        stages.start('compare charts', len(clusteringDistances) + len(simRatios))
         columns = ["Algorithm", 'ClusteringDistance', 'CamHerdRatio'] #first fixed the variable values
         kcovChartBuilder2.compare(columns, clusteringDistances, simRatios, precision=1)
         columns = ["Algorithm", 'CamHerdRatio', 'ClusteringDistance']
         kcovChartBuilder2.compare(columns, simRatios, clusteringDistances)
+        chartPool.wait()
+        stages.stop()
+
+    chartPool.close()
+    chartManifest.save()
+    print("Charts: " + str(chartManifest.rendered) + " drawn, " + str(chartManifest.skipped) + " up to date")
+    if previewCharts:
+        print("Previews: " + writeContactSheet(charts_dir, chartManifest.paths))
+    print(stages.summary())
+    if stageReport is not None:
+        stages.save(stageReport)
 
 
 